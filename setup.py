@@ -9,5 +9,7 @@ setup(name='skywalker',
       packages=find_packages(),
       include_package_data=True,
       description='Automated beam alignment for LCLS',
-      scripts=['scripts/lightpath', 'scripts/skywalker']
+      scripts=['scripts/lightpath', 'scripts/skywalker',
+               'scripts/skywalker-compile-config',
+               'scripts/skywalker-config-service']
       )
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Validation and compilation of the Skywalker configuration files
+
+The happi database, system and alignment files are checked against each other
+once, ahead of time, and written to a single pre-resolved artifact. A
+:class:`.ConfigReader` created from the artifact can then skip parsing and
+cross-referencing the files at startup, and mistakes such as a system pointing
+at a missing or inactive device are reported when the configuration is
+compiled rather than when the device is first requested.
+"""
+import os
+import os.path
+import logging
+
+import simplejson
+import pcdsdevices
+
+from skywalker.diskcache import atomic_write, file_digest, fingerprint
+
+logger = logging.getLogger(__name__)
+
+#Artifacts written with any other version are rejected by load_artifact
+ARTIFACT_VERSION = 1
+
+DEVICE_TYPES = ('mirror', 'imager', 'slits')
+
+
+def parse_metadata(happi_json, system_json):
+    """
+    Read the happi database and system information
+
+    Parameters
+    ----------
+    happi_json : str
+        Path to the happi database
+
+    system_json : str
+        Path to the system information
+
+    Returns
+    -------
+    data : dict
+        The happi `documents` keyed by device name, the `device_class`,
+        `args` and `kwargs` needed to create each device under `resolved`,
+        and the system information under `systems`
+    """
+    logger.debug("Reading happi database %s", happi_json)
+    with open(happi_json, 'r') as f:
+        raw = simplejson.load(f)
+    documents = dict((doc['name'], doc) for doc in raw.values())
+    resolved = dict((name, {'device_class': doc.get('device_class'),
+                            'args': doc.get('args') or [],
+                            'kwargs': doc.get('kwargs') or {}})
+                    for name, doc in documents.items())
+    with open(system_json, 'r') as f:
+        systems = simplejson.load(f)
+    return {'documents': documents, 'resolved': resolved,
+            'systems': systems}
+
+
+def validate(documents, systems, alignments=None):
+    """
+    Check that the configuration files are consistent
+
+    Parameters
+    ----------
+    documents : dict
+        Happi documents keyed by device name
+
+    systems : dict
+        System information keyed by system name
+
+    alignments : dict, optional
+        Alignment procedures, each a list of lists of system names
+
+    Returns
+    -------
+    problems : list of str
+        Description of every problem found. Empty if the configuration is
+        valid
+    """
+    problems = list()
+    for system, info in sorted(systems.items()):
+        if 'rotation' not in info:
+            problems.append("System {} has no rotation".format(system))
+        for dev_type in DEVICE_TYPES:
+            name = info.get(dev_type)
+            if name is None:
+                problems.append("System {} does not have a {} object "
+                                "registered".format(system, dev_type))
+                continue
+            doc = documents.get(name)
+            if doc is None:
+                problems.append("The {} {} of system {} is not in the "
+                                "database".format(dev_type, name, system))
+                continue
+            if not doc.get('active', False):
+                problems.append("The {} {} of system {} is not active"
+                                "".format(dev_type, name, system))
+            device_class = doc.get('device_class')
+            if not hasattr(pcdsdevices, str(device_class)):
+                problems.append("The {} {} of system {} has unknown device "
+                                "class {}".format(dev_type, name, system,
+                                                  device_class))
+    for procedure, key_sets in sorted((alignments or {}).items()):
+        for key_set in key_sets:
+            for system in key_set:
+                if system not in systems:
+                    problems.append("Procedure {} uses unknown system {}"
+                                    "".format(procedure, system))
+    return problems
+
+
+def compile_config(happi_json, system_json, alignment_json=None):
+    """
+    Read and validate the configuration files
+
+    Parameters
+    ----------
+    happi_json : str
+        Path to the happi database
+
+    system_json : str
+        Path to the system information
+
+    alignment_json : str, optional
+        Path to the alignment procedures
+
+    Returns
+    -------
+    artifact : dict
+        Pre-resolved configuration, suitable for :func:`.write_artifact`
+
+    problems : list of str
+        Everything that failed validation
+    """
+    sources = {'happi': happi_json, 'system': system_json,
+               'alignments': alignment_json}
+    sources = dict((key, os.path.abspath(path))
+                   for key, path in sources.items() if path)
+    #Fingerprint the files before reading them so that an edit in between
+    #makes the artifact outdated rather than current
+    fingerprints = dict((path, fingerprint(path))
+                        for path in sources.values())
+    data = parse_metadata(happi_json, system_json)
+    alignments = None
+    if alignment_json:
+        with open(alignment_json, 'r') as f:
+            alignments = simplejson.load(f)
+    problems = validate(data['documents'], data['systems'], alignments)
+    artifact = {'version': ARTIFACT_VERSION,
+                'sources': sources,
+                'fingerprints': fingerprints,
+                'alignments': alignments}
+    artifact.update(data)
+    return artifact, problems
+
+
+def write_artifact(artifact, path):
+    """
+    Write a compiled configuration to disk
+
+    Parameters
+    ----------
+    artifact : dict
+        Result of :func:`.compile_config`
+
+    path : str
+        Destination of the artifact
+    """
+    atomic_write(path, lambda f: simplejson.dump(artifact, f,
+                                                 separators=(',', ':')))
+    logger.info("Wrote compiled configuration to %s", path)
+
+
+def load_artifact(path):
+    """
+    Read a compiled configuration
+
+    Parameters
+    ----------
+    path : str
+        Location of the artifact
+
+    Returns
+    -------
+    artifact : dict
+
+    Raises
+    ------
+    ValueError:
+        If the artifact was written by an incompatible version
+    """
+    with open(path, 'r') as f:
+        artifact = simplejson.load(f)
+    if artifact.get('version') != ARTIFACT_VERSION:
+        raise ValueError("Compiled configuration {} has version {}, expected "
+                         "{}".format(path, artifact.get('version'),
+                                     ARTIFACT_VERSION))
+    return artifact
+
+
+def is_current(artifact):
+    """
+    Whether the files an artifact was compiled from are unchanged
+
+    The modification time and size of each file is checked first, falling
+    back to comparing the contents of files that were only touched
+    """
+    for source, compiled in artifact['fingerprints'].items():
+        try:
+            current = fingerprint(source, digest=False)
+        except OSError:
+            logger.warning("%s no longer exists", source)
+            return False
+        if all(compiled[key] == current[key] for key in current):
+            continue
+        if compiled['sha1'] != file_digest(source):
+            logger.warning("%s has changed since the configuration was "
+                           "compiled", source)
+            return False
+    return True
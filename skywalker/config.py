@@ -1,136 +1,2101 @@
+import os.path
+import asyncio
 import logging
+import time
+import threading
+from functools import partial, reduce
+from collections import Counter, OrderedDict, namedtuple
+from collections.abc import MutableMapping
+from concurrent.futures import (ThreadPoolExecutor, Future, wait,
+                                as_completed, TimeoutError as FutureTimeout)
 
 import happi
-import simplejson
 from happi.backends import JSONBackend
 
 import pcdsdevices
-from pcdsdevices import sim, OffsetMirror
+from pcdsdevices import OffsetMirror
 from pcdsdevices.happireader import construct_device
-from pswalker.examples import patch_pims
+
+from skywalker.compiler import load_artifact, is_current, parse_metadata
+from skywalker.diskcache import MetadataCache, fingerprint
+from skywalker.report import LoadReport
+from skywalker.service import fetch_metadata
 
 logger = logging.getLogger(__name__)
 
-#####################
-# Simulated Devices #
-#####################
-#Source
-s   = sim.source.Undulator('test_undulator', name='test_undulator')
-
-#Mirrors
-m1  = sim.mirror.OffsetMirror('test_m1h', 'test_m1h_xy', name='test_m1h',
-                              z=90.510, alpha=0.0014)
-m2  = sim.mirror.OffsetMirror('test_m2h', 'test_m2h_xy', name='test_m2h',
-                              x=0.0317324, z=101.843, alpha=0.0014)
-xrtm2 = sim.mirror.OffsetMirror('test_xrtm2', 'test_xrtm2_xy',
-                                name='test_xrtm2',
-                                x=0.0317324, z=200, alpha=0.0014)
-#Imagers
-y1     = sim.pim.PIM('test_p3h', x=0.0317324, z=103.660, name='test_p3h',
-                     zero_outside_yag=True)
-y2     = sim.pim.PIM('test_dg3', x=0.0317324, z=375.000, name='test_dg3',
-                     zero_outside_yag=True)
-mecy1  = sim.pim.PIM('test_mecy1', x=0.0317324, z=350, name='test_mect1',
-                     zero_outside_yag=True)
-mfxdg1 = mecy1
-
-#Create simulation with proper distances
-patch_pims([y1, y2], mirrors=[m1, m2], source=s)
-patch_pims([mecy1], mirrors=[xrtm2], source=s)
-
-#Pseudo-config
-sim_config = {'sim_m1h' : {'mirror'   : m1,
-                           'imager'   : y1,
-                           'rotation' : 0,
-                           'slits'    : None},
-              'sim_m2h' : {'mirror'   : m2,
-                           'imager'   : y2,
-                           'rotation' : 0,
-                           'slits'    : None},
-              'sim_mfx' : {'mirror'   : xrtm2,
-                           'imager'   : mfxdg1,
-                           'rotation' : 0,
-                           'slits'    : None}}
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'currsize'])
+ConfigChanges = namedtuple('ConfigChanges', ['added', 'removed', 'changed',
+                                             'systems'])
+
+#####################
+# Simulated Devices #
+#####################
+_sim_config = None
+
+
+def build_sim_config():
+    """
+    Create the devices of the simulated beamline
+
+    Returns
+    -------
+    sim_config : dict
+        Pseudo-config mapping each simulated system to its devices
+    """
+    #Only needed in simulation mode, so imported here to keep import fast
+    from pcdsdevices import sim
+    from pswalker.examples import patch_pims
+
+    #Source
+    s   = sim.source.Undulator('test_undulator', name='test_undulator')
+
+    #Mirrors
+    m1  = sim.mirror.OffsetMirror('test_m1h', 'test_m1h_xy', name='test_m1h',
+                                  z=90.510, alpha=0.0014)
+    m2  = sim.mirror.OffsetMirror('test_m2h', 'test_m2h_xy', name='test_m2h',
+                                  x=0.0317324, z=101.843, alpha=0.0014)
+    xrtm2 = sim.mirror.OffsetMirror('test_xrtm2', 'test_xrtm2_xy',
+                                    name='test_xrtm2',
+                                    x=0.0317324, z=200, alpha=0.0014)
+    #Imagers
+    y1     = sim.pim.PIM('test_p3h', x=0.0317324, z=103.660, name='test_p3h',
+                         zero_outside_yag=True)
+    y2     = sim.pim.PIM('test_dg3', x=0.0317324, z=375.000, name='test_dg3',
+                         zero_outside_yag=True)
+    mecy1  = sim.pim.PIM('test_mecy1', x=0.0317324, z=350, name='test_mect1',
+                         zero_outside_yag=True)
+    mfxdg1 = mecy1
+
+    #Create simulation with proper distances
+    patch_pims([y1, y2], mirrors=[m1, m2], source=s)
+    patch_pims([mecy1], mirrors=[xrtm2], source=s)
+
+    #Pseudo-config
+    return {'sim_m1h' : {'mirror'   : m1,
+                         'imager'   : y1,
+                         'rotation' : 0,
+                         'slits'    : None},
+            'sim_m2h' : {'mirror'   : m2,
+                         'imager'   : y2,
+                         'rotation' : 0,
+                         'slits'    : None},
+            'sim_mfx' : {'mirror'   : xrtm2,
+                         'imager'   : mfxdg1,
+                         'rotation' : 0,
+                         'slits'    : None}}
+
+
+def get_sim_config():
+    """
+    The simulated beamline, created the first time it is requested
+    """
+    global _sim_config
+    if _sim_config is None:
+        logger.debug("Creating simulated beamline")
+        _sim_config = build_sim_config()
+    return _sim_config
+
+sim_alignments = {'HOMS': [['sim_m1h', 'sim_m2h']],
+                  'MFX': [['sim_mfx']]}
+
+
+def build_sim_beamline(n_mirrors, n_imagers=None, spacing=10., start=90.,
+                       alpha=0.0014, rotation=0):
+    """
+    Create a simulated beamline of arbitrary size
+
+    Mirrors are arranged in branches of two, matching the two bounce model
+    used by ``patch_pims``, with every branch starting at the same `start`. The
+    imagers are shared out between the mirrors in order and placed evenly
+    between each mirror and the next. Every imager forms a system with the
+    mirror directly upstream of it, and every branch forms an alignment
+    procedure
+
+    Parameters
+    ----------
+    n_mirrors : int
+        Number of mirrors
+
+    n_imagers : int, optional
+        Number of imagers. One per mirror by default
+
+    spacing : float, optional
+        Distance between consecutive mirrors of a branch
+
+    start : float, optional
+        Position of the first mirror of each branch
+
+    alpha : float, optional
+        Pitch of every mirror
+
+    rotation : float, optional
+        Rotation of the image of every system
+
+    Returns
+    -------
+    sim_config : dict
+        Pseudo-config mapping each system to its devices
+
+    alignments : dict
+        Alignment procedures using the systems in `sim_config`
+    """
+    from pcdsdevices import sim
+    from pswalker.examples import patch_pims
+
+    n_imagers = n_mirrors if n_imagers is None else n_imagers
+    s = sim.source.Undulator('sim_undulator', name='sim_undulator')
+    mirrors = list()
+    positions = list()
+    for i in range(n_mirrors):
+        name = 'sim_mirror_{:04}'.format(i)
+        #The second mirror of a branch sits in the reflected beam
+        bounce = i % 2
+        x, z = bounce * 2 * alpha * spacing, start + bounce * spacing
+        mirrors.append(sim.mirror.OffsetMirror(name, name + '_xy', name=name,
+                                               x=x, z=z, alpha=alpha))
+        positions.append((x, z))
+    #Assign the imagers to the mirrors in order
+    assigned = [list() for mirror in mirrors]
+    for j in range(n_imagers):
+        assigned[j * n_mirrors // n_imagers].append(j)
+
+    sim_config = dict()
+    alignments = dict()
+    for i, mirror in enumerate(mirrors):
+        first = i - i % 2
+        mirror_x, mirror_z = positions[i]
+        imagers = list()
+        for k, j in enumerate(assigned[i]):
+            z = mirror_z + spacing * (k + 1) / (len(assigned[i]) + 1)
+            #Beam is parallel to the line after the second bounce
+            if i % 2:
+                x = mirror_x
+            else:
+                x = 2 * alpha * (z - mirror_z)
+            name = 'sim_imager_{:04}'.format(j)
+            imager = sim.pim.PIM(name, x=x, z=z, name=name,
+                                 zero_outside_yag=True)
+            imagers.append(imager)
+            system = 'sim_{:04}'.format(j)
+            sim_config[system] = {'mirror'   : mirror,
+                                  'imager'   : imager,
+                                  'rotation' : rotation,
+                                  'slits'    : None}
+            procedure = 'Branch {}'.format(i // 2)
+            alignments.setdefault(procedure, [[]])[0].append(system)
+        if imagers:
+            patch_pims(imagers, mirrors=mirrors[first:first + 2], source=s)
+    return sim_config, alignments
+
+
+def walk_signals(device, prefix=''):
+    """
+    Iterate through every signal of a device and its sub-devices
+
+    Lazy signals are instantiated as they are reached, which also begins
+    their connection
+
+    Parameters
+    ----------
+    device : ophyd.Device
+
+    prefix : str, optional
+        Prefix for the attribute names that are reported
+
+    Yields
+    ------
+    attr, signal : str, ophyd.Signal
+        Dotted attribute name of the signal and the signal itself
+    """
+    for attr in device.component_names:
+        obj = getattr(device, attr)
+        if hasattr(obj, 'component_names'):
+            yield from walk_signals(obj, prefix=prefix + attr + '.')
+        else:
+            yield prefix + attr, obj
+
+
+def count_signals(device):
+    """
+    Count the signals of a device without instantiating any lazy signals
+
+    Parameters
+    ----------
+    device : ophyd.Device
+
+    Returns
+    -------
+    total, created, connected : int
+        Number of signals the device defines, how many of those have been
+        instantiated and how many of those are connected
+    """
+    (total, created, connected) = (0, 0, 0)
+    #Components that have been instantiated, if the device tracks them
+    instantiated = getattr(device, '_signals', None)
+    for attr in device.component_names:
+        if instantiated is None:
+            obj = getattr(device, attr)
+        else:
+            obj = instantiated.get(attr)
+        if obj is None:
+            total += 1
+        elif hasattr(obj, 'component_names'):
+            counts = count_signals(obj)
+            total += counts[0]
+            created += counts[1]
+            connected += counts[2]
+        else:
+            total += 1
+            created += 1
+            connected += bool(obj.connected)
+    return total, created, connected
+
+
+def wait_for_signals(signals, timeout=1):
+    """
+    Wait for a group of signals to connect
+
+    Parameters
+    ----------
+    signals : list
+        Pairs of attribute name and signal
+
+    timeout : float, optional
+        Time to wait for every signal
+
+    Returns
+    -------
+    unconnected : list of str
+        Attribute names of the signals that did not connect in time
+    """
+    deadline = time.time() + timeout
+    while True:
+        unconnected = [attr for (attr, sig) in signals if not sig.connected]
+        if not unconnected or time.time() >= deadline:
+            return unconnected
+        time.sleep(min(0.05, timeout / 10.))
+
+
+def combine_futures(futures):
+    """
+    Future that completes once every future in a group has finished
+
+    Parameters
+    ----------
+    futures : list of concurrent.futures.Future
+
+    Returns
+    -------
+    combined : concurrent.futures.Future
+        Holds the list of results in the same order as `futures`, or the
+        first exception raised by any of them
+    """
+    combined = Future()
+    futures = list(futures)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(future):
+        with lock:
+            if combined.done():
+                return
+            if future.exception() is not None:
+                combined.set_exception(future.exception())
+                return
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                combined.set_result([f.result() for f in futures])
+
+    if not futures:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(on_done)
+    return combined
+
+
+class DeviceLoadError(RuntimeError, AttributeError):
+    """
+    Raised when a :class:`.LazyDevice` is unable to create its device
+
+    This is also an AttributeError, so ``hasattr`` and ``getattr`` with a
+    default treat an unloadable proxy as missing the attribute
+    """
+    pass
+
+
+class LazyDevice:
+    """
+    Stand-in for a device that is only created when it is first used
+
+    The proxy is built from the happi container, so the basic metadata of the
+    device; `name`, `prefix`, `z` and `beamline`, are available without
+    touching EPICS. The first time any other attribute is requested the real
+    device is instantiated, connected and all further attribute access is
+    forwarded to it.
+
+    Parameters
+    ----------
+    container : happi.Device
+        Happi container describing the device
+
+    factory : callable
+        Function that returns the loaded device or `None` if the device could
+        not be created
+    """
+    _proxy_attrs = ('_container', '_factory', '_device', '_lock',
+                    'name', 'prefix', 'z', 'beamline')
+
+    def __init__(self, container, factory):
+        object.__setattr__(self, '_container', container)
+        object.__setattr__(self, '_factory', factory)
+        object.__setattr__(self, '_device', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+        for attr in ('name', 'prefix', 'z', 'beamline'):
+            object.__setattr__(self, attr, getattr(container, attr, None))
+
+    @property
+    def loaded(self):
+        """
+        Whether the underlying device has been created
+        """
+        return self._device is not None
+
+    @property
+    def container(self):
+        """
+        Happi container used to create the proxy
+        """
+        return self._container
+
+    def load(self):
+        """
+        Create the underlying device if it has not been already
+
+        Returns
+        -------
+        device : `pcdsdevices.Device`
+
+        Raises
+        ------
+        DeviceLoadError:
+            If the device can not be loaded
+        """
+        with self._lock:
+            if self._device is None:
+                logger.debug("First use of %s, loading device", self.name)
+                dev = self._factory()
+                if dev is None:
+                    raise DeviceLoadError("Unable to load device {}"
+                                          "".format(self.name))
+                object.__setattr__(self, '_device', dev)
+        return self._device
+
+    def __getattr__(self, attr):
+        #Only called for attributes not found on the proxy itself
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        if attr in self._proxy_attrs:
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self.load(), attr, value)
+
+    def __repr__(self):
+        return '{}(name={!r}, loaded={})'.format(self.__class__.__name__,
+                                                 self.name, self.loaded)
+
+
+def teardown_device(device):
+    """
+    Release the resources held by a device
+
+    All subscriptions to the device are removed and the device is destroyed so
+    that its EPICS channels are closed. A :class:`.LazyDevice` that was never
+    used has nothing to release
+
+    Parameters
+    ----------
+    device : ophyd.Device or LazyDevice
+    """
+    if isinstance(device, LazyDevice):
+        if not device.loaded:
+            return
+        device = device.load()
+    for method in ('unsubscribe_all', 'destroy'):
+        try:
+            getattr(device, method)()
+        except AttributeError:
+            pass
+        except Exception:
+            logger.exception("Error calling %s on %s", method,
+                             getattr(device, 'name', device))
+
+
+class SubsystemCache(MutableMapping):
+    """
+    Least recently used cache of loaded subsystems
+
+    Retrieving a subsystem marks it as recently used. Once the cache holds more
+    than `maxsize` systems the least recently used system that is not pinned
+    is evicted. The most recently used system is always kept, so the cache
+    may temporarily grow beyond `maxsize` if every other system is pinned.
+    Eviction calls `on_evict` with the name of the system and its devices so
+    that they can be cleaned up, while deleting an entry directly does not
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Number of systems to hold. Unlimited by default
+
+    on_evict : callable, optional
+        Called as ``on_evict(system, subsystem)`` after a system is evicted
+
+    lock : threading.RLock, optional
+        Lock held for every operation, including the call to `on_evict`
+    """
+    def __init__(self, maxsize=None, on_evict=None, lock=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self.pinned = set()
+        self._data = OrderedDict()
+        self._lock = lock or threading.RLock()
+
+    def __getitem__(self, system):
+        with self._lock:
+            subsystem = self._data[system]
+            self._data.move_to_end(system)
+            return subsystem
+
+    def __setitem__(self, system, subsystem):
+        with self._lock:
+            self._data[system] = subsystem
+            self._data.move_to_end(system)
+            self._shrink()
+
+    def __delitem__(self, system):
+        with self._lock:
+            del self._data[system]
+
+    def __contains__(self, system):
+        return system in self._data
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._data)
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def values(self):
+        with self._lock:
+            return list(self._data.values())
+
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    @property
+    def full(self):
+        """
+        Whether adding another system would evict one
+        """
+        return self.maxsize is not None and len(self) >= self.maxsize
+
+    def pin(self, systems):
+        """
+        Protect systems from eviction, replacing the previously pinned systems
+
+        Parameters
+        ----------
+        systems : list of str
+        """
+        with self._lock:
+            self.pinned = set(systems)
+            self._shrink()
+
+    def evict(self, system):
+        """
+        Remove a system and pass it to `on_evict`
+        """
+        with self._lock:
+            subsystem = self._data.pop(system)
+            logger.debug("Evicting %s from the subsystem cache", system)
+            if self.on_evict is not None:
+                self.on_evict(system, subsystem)
+
+    def _shrink(self):
+        if self.maxsize is None:
+            return
+        #Oldest systems first, never evicting the system that was just used
+        for system in list(self._data)[:-1]:
+            if len(self._data) <= self.maxsize:
+                break
+            if system not in self.pinned:
+                self.evict(system)
+
+
+class SingleFlight:
+    """
+    Share the result of a call between every thread that asks for the same
+    key while it is running
+
+    The first thread to request a key becomes responsible for producing the
+    result, and any other thread that asks for the key in the meantime waits
+    for that result instead of repeating the work. Once the result is
+    available the key is released, so a later request starts afresh
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = dict()
+
+    def claim(self, key):
+        """
+        Register interest in a key
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Future that will hold the result for the key
+
+        leader : bool
+            Whether the caller is responsible for producing the result and
+            passing it to :meth:`.finish`
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def pending(self):
+        """
+        Keys that are currently claimed
+        """
+        with self._lock:
+            return list(self._calls)
+
+    def finish(self, key, result=None, exception=None):
+        """
+        Publish the result for a key claimed with :meth:`.claim`
+        """
+        with self._lock:
+            future = self._calls.pop(key)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Call a function unless another thread is already doing so for the
+        same key, in which case wait for its result
+        """
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as exc:
+            self.finish(key, exception=exc)
+            raise
+        self.finish(key, result=result)
+        return result
+
+
+class ConfigReader:
+    """
+    Device to store and load devices neccesary for alignment
+
+    The configuration is dependent on two seperate JSON files. The first of
+    which is the standard configuration file created by the `JSONBackend` for
+    happi. This contains all the necessary devices for alignment. The second of
+    which is a JSON file that contains all the device names grouped into single
+    subsystems consisting of a slit, a mirror, an imager, and a rotation for
+    the YAG.
+
+    At initialization the system names and mapping are loaded into the
+    ConfigReader, then a user can request that a subsystem be loaded by using
+    :meth:`.get_subystem`. This looks in the system description for each child
+    devices name, requests the child device's information in happi and
+    instantiates the correct pcdsdevice. Once this has been done in happi,
+    subsequent requests will simply returned cached value as to avoid
+    unnecessary device creation. Devices are also cached individually by
+    name, so a device shared between systems is only created once.
+
+    Parameters
+    ----------
+    happi_json : str
+        Path to JSON file that contains happi information
+
+    system_json : str
+        Path to JSON file that holds device names to load from happi
+
+    lazy : bool, optional
+        Return :class:`.LazyDevice` proxies instead of connected devices. Each
+        device is only created and connected the first time it is used
+
+    cache_dir : str, optional
+        Directory to keep a :class:`.MetadataCache` of the parsed database and
+        system information. If the JSON files have not changed since the last
+        time they were read, the cached information is used instead
+
+    cache_size : int, optional
+        Maximum number of subsystems to keep loaded. When more are loaded the
+        least recently used system is evicted and its devices are destroyed,
+        unless they are shared with another loaded system. Systems passed to
+        :meth:`.pin` are never evicted. Unlimited by default
+
+    artifact : str, optional
+        Compiled configuration created by ``skywalker-compile-config``. If
+        the source files are unchanged since it was compiled, the database and
+        system information are taken from the artifact instead of the files,
+        along with the alignment procedures in :attr:`.alignments`. The paths
+        of the source files are taken from the artifact if they are `None`
+
+    service : str, optional
+        Socket of a :class:`.ConfigService`. If the service is running and
+        serving the same files, the parsed information is requested from it
+        rather than reading the files. Otherwise the files are used
+
+    background : bool, optional
+        Return devices before they are connected and finish connecting them
+        in the background. Ignored in lazy mode, where devices connect when
+        they are first used
+
+    Notes
+    -----
+    Every device that is created is timed and the results are kept in
+    :attr:`.report`, a :class:`.LoadReport`.
+
+    Devices that fail to load are not attempted again until a backoff period
+    has passed, starting at :attr:`.retry_delay` seconds and doubling with each
+    consecutive failure up to :attr:`.max_retry_delay`. Use :meth:`.retry` to
+    clear this and attempt a device again immediately.
+
+    Both JSON files can be edited while the ConfigReader is in use. Calling
+    :meth:`.reload` rereads them if they have changed and only recreates the
+    devices and systems that were affected by the edit.
+
+    A ConfigReader can be used from several threads at once. If a device or
+    system is requested while another thread is already loading it, the
+    request waits for that load to finish and shares its result rather than
+    creating a second copy.
+
+    In `background` mode devices are returned as soon as they are created and
+    connect in a pool of :attr:`.connect_workers` threads. Use :meth:`.ready`
+    and :meth:`.system_ready` to find out when they are usable. A device that
+    fails to connect is removed from the caches along with the systems that
+    contain it.
+    """
+    device_types = ['mirror', 'imager', 'slits']
+    info_swap    = {'mirror' : {'states' : 'prefix_xy'},
+                    'imager' : {'data'   : 'prefix_det'}}
+    #Beamlines that carry the beam to each hutch before its own devices
+    upstream_beamlines = {'XPP': ['HXD'],
+                          'XCS': ['HXD', 'PBT'],
+                          'MFX': ['HXD'],
+                          'CXI': ['HXD'],
+                          'MEC': ['HXD']}
+    #Signals the application uses for each device class. Only these are
+    #connected when a device is loaded, the rest are left lazy. Classes that
+    #are not listed connect all of their signals
+    signal_manifests = {'OffsetMirror': ['pitch.user_readback',
+                                         'pitch.user_setpoint',
+                                         'pitch.motor_done_move'],
+                        'PIM': ['detector.image2.width',
+                                'detector.image2.array_data',
+                                'detector.stats2.centroid.x',
+                                'detector.stats2.centroid.y',
+                                'detector.cam.array_size.array_size_x',
+                                'detector.cam.array_size.array_size_y',
+                                'states.state'],
+                        'Slits': ['xwidth.readback',
+                                  'ywidth.readback',
+                                  'xwidth.setpoint',
+                                  'ywidth.setpoint',
+                                  'xwidth.done',
+                                  'ywidth.done']}
+    lazy = False
+    background = False
+    connect_workers = 16
+    retry_delay = 5.0
+    max_retry_delay = 300.0
+
+    def __init__(self, happi_json, system_json, lazy=False, cache_dir=None,
+                 cache_size=None, artifact=None, service=None,
+                 background=False):
+        self.happi_json = happi_json
+        self.system_json = system_json
+        self.cache_dir = cache_dir
+        self.artifact = artifact
+        self.service = service
+        self.alignments = None
+        #Guards the caches. Never held while waiting on a connection
+        self._lock = threading.RLock()
+        self._device_flight = SingleFlight()
+        self._system_flight = SingleFlight()
+        #Load database and system information
+        self.load_metadata()
+        #Load happi client
+        self.client  = happi.Client(database=JSONBackend(self.happi_json))
+        #Create cache of previously loaded systems and devices
+        self.cache = SubsystemCache(maxsize=cache_size,
+                                    on_evict=self._teardown_system,
+                                    lock=self._lock)
+        self.devices = {}
+        self.device_stats = Counter()
+        self.failures = {}
+        self.report = LoadReport()
+        self.lazy = lazy
+        self.background = background
+        self._connector = None
+        self._readiness = dict()
+        self._reload_callbacks = list()
+        self._evict_callbacks = list()
+
+    def load_metadata(self):
+        """
+        Read the happi database and system information
+
+        Every entry in the database is stored by name along with the resolved
+        `device_class`, `args` and `kwargs` used to instantiate it. This saves
+        searching the database each time a device is requested. The
+        information is taken from the first available of an up to date
+        `artifact`, the configuration `service`, the :class:`.MetadataCache`
+        in `cache_dir` and finally the files themselves
+        """
+        data = None
+        if self.artifact:
+            data = self._load_artifact()
+        #Remember the state of the files we are about to read
+        self._source_stats = self._get_source_stats()
+        if data is None and self.service:
+            data = fetch_metadata(self.service, self.happi_json,
+                                  self.system_json)
+        cache_dir = self.cache_dir
+        if data is None and cache_dir:
+            disk_cache = MetadataCache([self.happi_json, self.system_json],
+                                       cache_dir=cache_dir)
+            data = disk_cache.load()
+        #Parse the configuration files
+        if data is None:
+            if cache_dir:
+                fingerprints = disk_cache.fingerprints()
+            data = parse_metadata(self.happi_json, self.system_json)
+            if cache_dir:
+                disk_cache.save(data, fingerprints)
+        self.documents = data['documents']
+        self.resolved = data['resolved']
+        self.live_systems = data['systems']
+        self.build_indexes()
+
+    def _load_artifact(self):
+        """
+        Read the compiled configuration, returning `None` if it can not be
+        used
+        """
+        try:
+            compiled = load_artifact(self.artifact)
+        except Exception:
+            #Nothing to fall back on
+            if self.happi_json is None or self.system_json is None:
+                raise
+            logger.exception("Unable to read compiled configuration %s",
+                             self.artifact)
+            return None
+        sources = compiled['sources']
+        for key, path in (('happi', self.happi_json),
+                          ('system', self.system_json)):
+            if path is not None and os.path.abspath(path) != sources.get(key):
+                logger.warning("Ignoring compiled configuration %s, it was "
+                               "built from other files", self.artifact)
+                return None
+        self.happi_json = self.happi_json or sources['happi']
+        self.system_json = self.system_json or sources['system']
+        if not is_current(compiled):
+            logger.warning("Ignoring outdated compiled configuration %s",
+                           self.artifact)
+            return None
+        logger.debug("Using compiled configuration %s", self.artifact)
+        self.alignments = compiled['alignments']
+        return compiled
+
+    @classmethod
+    def from_artifact(cls, artifact, **kwargs):
+        """
+        Create a ConfigReader from a compiled configuration
+
+        Parameters
+        ----------
+        artifact : str
+            Path to the output of ``skywalker-compile-config``
+
+        kwargs :
+            Passed to the ConfigReader
+        """
+        return cls(None, None, artifact=artifact, **kwargs)
+
+    def _get_source_stats(self):
+        """
+        Modification information of the happi and system files
+        """
+        stats = list()
+        for path in (self.happi_json, self.system_json):
+            try:
+                stats.append(fingerprint(path, digest=False))
+            except OSError:
+                stats.append(None)
+        return stats
+
+    def has_changed(self):
+        """
+        Whether the happi or system files have changed since they were read
+        """
+        return self._get_source_stats() != self._source_stats
+
+    def reload(self, force=False):
+        """
+        Reread the configuration files and update the loaded devices
+
+        The new database and system information is compared to the previous
+        version. Devices whose entries were added, removed or edited, and the
+        systems that contain them, are dropped from the caches. Devices and
+        systems that had already been loaded are recreated, while everything
+        else that was unaffected by the edit is left connected. Functions
+        registered with :meth:`.add_reload_callback` are called with the
+        differences afterwards
+
+        Parameters
+        ----------
+        force : bool, optional
+            Reread the files even if they do not appear to have changed
+
+        Returns
+        -------
+        changes : ConfigChanges or None
+            Names of the `added`, `removed` and `changed` devices as well as
+            the affected `systems`. `None` if nothing was reloaded
+        """
+        if not force and not self.has_changed():
+            return None
+        old_documents = self.documents
+        old_systems = self.live_systems
+        logger.info("Configuration files have changed, reloading ...")
+        try:
+            with self._lock:
+                self.load_metadata()
+        except Exception:
+            #Files may be caught halfway through an edit. Keep using the old
+            #configuration until they change again
+            logger.exception("Unable to reload configuration")
+            return None
+        #Compare devices
+        added = [name for name in self.documents if name not in old_documents]
+        removed = [name for name in old_documents
+                   if name not in self.documents]
+        changed = [name for name in self.documents
+                   if name in old_documents
+                   and self.documents[name] != old_documents[name]]
+        #Compare systems
+        modified = set(added + removed + changed)
+        systems = set()
+        for system in set(old_systems) | set(self.live_systems):
+            if old_systems.get(system) != self.live_systems.get(system):
+                systems.add(system)
+            elif any(name in modified
+                     for name in self.live_systems[system].values()
+                     if isinstance(name, str)):
+                systems.add(system)
+        changes = ConfigChanges(added, removed, changed, sorted(systems))
+        logger.debug("Configuration changes: %s", changes)
+        #Drop everything that is out of date
+        with self._lock:
+            stale_devices = [name for name in removed + changed
+                             if name in self.devices]
+            stale_systems = [system for system in systems
+                             if system in self.cache]
+            outdated = list()
+            for name in stale_devices:
+                outdated.append(self.devices.pop(name))
+                self._readiness.pop(name, None)
+            for system in stale_systems:
+                self.cache.pop(system)
+            #Edited devices deserve a fresh attempt
+            for name in modified:
+                self.failures.pop(name, None)
+        #Recreate only what was in use before
+        for name in stale_devices:
+            if name in self.documents:
+                self.load_device(name)
+        for system in stale_systems:
+            if system in self.live_systems:
+                self.get_subsystem(system)
+        #Notify
+        for callback in list(self._reload_callbacks):
+            try:
+                callback(changes)
+            except Exception:
+                logger.exception("Error in reload callback %s", callback)
+        #Release the replaced devices once nothing should be using them
+        for dev in outdated:
+            teardown_device(dev)
+        return changes
+
+    def add_reload_callback(self, callback):
+        """
+        Register a function to be called after the configuration is reloaded
+
+        Parameters
+        ----------
+        callback : callable
+            Called with a single ConfigChanges argument
+        """
+        self._reload_callbacks.append(callback)
+
+    def remove_reload_callback(self, callback):
+        """
+        Stop calling a function registered with :meth:`.add_reload_callback`
+        """
+        try:
+            self._reload_callbacks.remove(callback)
+        except ValueError:
+            pass
+
+    def build_indexes(self):
+        """
+        Create the lookup tables used to search the configuration
+
+        This needs to be called whenever :attr:`.documents` or
+        :attr:`.live_systems` change. The following tables are created:
+
+        * `systems_with_dict` - device name to the systems that use it
+        * `system_index` - system name to the device names of each type and
+          the rotation of the imager
+        * `device_class_index` - `device_class` to device names
+        * `beamline_index` - beamline to device names
+        * `prefix_index` - device prefix to device name
+        * `container_index` - device name to happi container, filled as
+          containers are requested by :meth:`.find_container`
+        """
+        systems_with = dict()
+        system_index = dict()
+        for system, components in self.live_systems.items():
+            info = dict.fromkeys(self.device_types)
+            info['rotation'] = components.get('rotation', 0)
+            for dev_type in self.device_types:
+                name = components.get(dev_type)
+                if isinstance(name, str):
+                    info[dev_type] = name
+                    systems = systems_with.setdefault(name, [])
+                    if system not in systems:
+                        systems.append(system)
+            system_index[system] = info
+        device_class_index = dict()
+        beamline_index = dict()
+        prefix_index = dict()
+        for name, doc in self.documents.items():
+            device_class_index.setdefault(doc.get('device_class'),
+                                          []).append(name)
+            beamline_index.setdefault(doc.get('beamline'), []).append(name)
+            prefix_index.setdefault(doc.get('prefix'), name)
+        self.systems_with_dict = systems_with
+        self.system_index = system_index
+        self.device_class_index = device_class_index
+        self.beamline_index = beamline_index
+        self.prefix_index = prefix_index
+        self.container_index = dict()
+
+    def find_container(self, name=None, prefix=None):
+        """
+        Find the happi container for a device
+
+        Lookups use the indexes of the database built at load time rather than
+        searching the happi backend. Containers are created on first request
+        and the same object is returned afterwards
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of the device
+
+        prefix : str, optional
+            Prefix of the device. Only used if no name is given
+
+        Returns
+        -------
+        container : happi.Device
+
+        Raises
+        ------
+        happi.errors.SearchError:
+            If no device matches
+        """
+        if name is None:
+            try:
+                name = self.prefix_index[prefix]
+            except KeyError:
+                raise happi.errors.SearchError("No device found with prefix "
+                                               "{}".format(prefix))
+        try:
+            return self.container_index[name]
+        except KeyError:
+            pass
+        try:
+            doc = self.documents[name]
+        except KeyError:
+            raise happi.errors.SearchError("No device found with name {}"
+                                           "".format(name))
+        info = dict((key, value) for key, value in doc.items()
+                    if key not in ('_id', 'type'))
+        container = self.client.create_device(doc['type'], **info)
+        #Keep the first container if another thread beat us to it
+        return self.container_index.setdefault(name, container)
+
+    @property
+    def available_systems(self):
+        """
+        All systems the ConfigReader has available mappings
+        """
+        return list(self.live_systems.keys())
+
+    def get_systems_with(self, key):
+        """
+        Get the systems that include the given device name.
+
+        Parameters
+        ----------
+        key : str
+            Name of a device
+
+        Returns
+        -------
+        systems : list of str
+            A list of systems that include the given device.
+        """
+        return list(self.systems_with_dict.get(key, []))
+
+    def get_system_info(self, system):
+        """
+        Get the device names and rotation of a system without loading it
+
+        Parameters
+        ----------
+        system : str
+            Name of the system
+
+        Returns
+        -------
+        info : dict
+            Device names keyed by mirror, imager and slits, as well as the
+            rotation of the imager. Missing devices are `None`
+        """
+        try:
+            return dict(self.system_index[system])
+        except KeyError:
+            logger.error("No system information found for %s", system)
+            return None
+
+    def get_devices_with(self, device_class=None, beamline=None):
+        """
+        Get the names of all the devices matching the given information
+
+        Parameters
+        ----------
+        device_class : str, optional
+            Name of the `pcdsdevices` class
+
+        beamline : str, optional
+            Name of the beamline
+
+        Returns
+        -------
+        names : list of str
+        """
+        names = None
+        for index, key in ((self.device_class_index, device_class),
+                           (self.beamline_index, beamline)):
+            if key is None:
+                continue
+            matches = index.get(key, [])
+            if names is None:
+                names = list(matches)
+            else:
+                matches = set(matches)
+                names = [name for name in names if name in matches]
+        if names is None:
+            return list(self.documents)
+        return names
+
+    def get_subsystem(self, system, timeout=30, use_cache=True):
+        """
+        Load the pcdsdevices corresponding to a system name
+
+        The mirror, imager and slits of the system are loaded concurrently. If
+        any of them fail to load the system is abandoned and not cached
+
+        Parameters
+        ----------
+        system : str
+            Name of subsystem to load
+
+        timeout : float, optional
+            Total time to wait for the devices of the system
+
+        use_cache : bool, optional
+            Search the cache for previously loaded devices before instantiating
+            new ones. True by default
+        Returns
+        -------
+        subsystem : dict
+            Dictionary containing keys for mirror, imager, slits and rotation
+        """
+        return self.get_subsystems([system], timeout=timeout,
+                                   use_cache=use_cache)[system]
+
+    def get_subsystems(self, systems, timeout=30, use_cache=True):
+        """
+        Load the pcdsdevices for a number of systems at once
+
+        The child devices of every requested system are loaded concurrently,
+        with devices shared between systems only loaded once. Systems are
+        otherwise handled exactly as :meth:`.get_subsystem`
+
+        Parameters
+        ----------
+        systems : list of str
+            Names of the subsystems to load
+
+        timeout : float, optional
+            Total time to wait for all of the devices
+
+        use_cache : bool, optional
+            Search the cache for previously loaded devices before instantiating
+            new ones. True by default
+
+        Returns
+        -------
+        subsystems : dict
+            Subsystem dictionaries keyed by system name
+        """
+        subsystems = dict()
+        requested = dict()
+        claimed = dict()
+        waiting = dict()
+        for system in systems:
+            #Reload previously accessed systems
+            cached = self.cache.get(system) if use_cache else None
+            if cached is not None:
+                logger.debug("Using cached devices for %s", system)
+                subsystems[system] = cached
+                continue
+            #Wait for systems that are being loaded by another thread
+            if system in claimed or system in waiting:
+                continue
+            future, leader = self._system_flight.claim(system)
+            if not leader:
+                logger.debug("Waiting for %s to be loaded", system)
+                waiting[system] = future
+                continue
+            claimed[system] = future
+            #The previous load may have finished while we were claiming
+            cached = self.cache.get(system) if use_cache else None
+            if cached is not None:
+                subsystems[system] = cached
+                continue
+
+            if system not in self.available_systems:
+                logger.error("No system information found for %s", system)
+
+            #Create new system
+            logger.info("Loading necessary device information from database")
+            #Get information from system names
+            try:
+                names = dict()
+                for dev_type in self.device_types:
+                    names[dev_type] = self.live_systems[system][dev_type]
+                rotation = self.live_systems[system]['rotation']
+            #System JSON failure
+            except KeyError:
+                logger.error("System %s does not have a %s object registered",
+                              system, dev_type)
+                subsystems[system] = dict.fromkeys(self.device_types)
+            else:
+                requested[system] = (names, rotation)
+        try:
+            self._load_systems(requested, subsystems, timeout, use_cache)
+        except BaseException as exc:
+            for system in claimed:
+                self._system_flight.finish(system, exception=exc)
+            raise
+        for system in claimed:
+            self._system_flight.finish(system, result=subsystems[system])
+        for system, future in waiting.items():
+            subsystems[system] = future.result()
+        return subsystems
+
+    def _load_systems(self, requested, subsystems, timeout, use_cache):
+        """
+        Load the devices of every requested system together, adding each
+        system to `subsystems`
+        """
+        unique = list(set(name for (names, rotation) in requested.values()
+                          for name in names.values()))
+        if unique:
+            loaded = self._load_concurrently(unique,
+                                             max_workers=len(unique),
+                                             deadline=timeout,
+                                             use_cache=use_cache)
+            loaded = dict(zip(unique, loaded))
+        for system, (names, rotation) in requested.items():
+            system_objs = dict.fromkeys(self.device_types)
+            for dev_type, name in names.items():
+                system_objs[dev_type] = loaded[name]
+            #Report if we did not recieve a device
+            if not all(system_objs[dev_type]
+                       for dev_type in self.device_types):
+                logger.error("Abandoning configuration load for %s",
+                             system)
+            #Cache system for quick recall
+            else:
+                system_objs['rotation'] = rotation
+                self._cache_system(system, names, system_objs)
+            subsystems[system] = system_objs
+
+    def _cache_system(self, system, names, system_objs):
+        """
+        Cache a loaded system unless one of its devices has been discarded
+        since it was loaded, either because it failed to connect in the
+        background or because :meth:`.reload` replaced it
+        """
+        with self._lock:
+            for dev_type, name in names.items():
+                if (self.devices.get(name) is not system_objs[dev_type]
+                        or self._connection_failed(name)):
+                    logger.debug("Not caching %s, %s was discarded",
+                                 system, name)
+                    return
+            self.cache[system] = system_objs
+
+    def __getitem__(self, key):
+        return self.cache.get(key, None)
+
+    def pin(self, systems):
+        """
+        Keep systems loaded regardless of the `cache_size`
+
+        Parameters
+        ----------
+        systems : list of str
+            Systems to protect, replacing any previously pinned systems
+        """
+        self.cache.pin(systems)
+
+    def add_evict_callback(self, callback):
+        """
+        Register a function to be called before an evicted system is torn down
+
+        Parameters
+        ----------
+        callback : callable
+            Called as ``callback(system, subsystem)``
+        """
+        self._evict_callbacks.append(callback)
+
+    def _teardown_system(self, system, subsystem):
+        """
+        Destroy the devices of an evicted system that no other loaded system
+        is using, or is about to use
+        """
+        for callback in list(self._evict_callbacks):
+            try:
+                callback(system, subsystem)
+            except Exception:
+                logger.exception("Error in evict callback %s", callback)
+        in_use = set(id(other.get(dev_type))
+                     for other in self.cache.values()
+                     for dev_type in self.device_types)
+        #Systems still being loaded may already hold the same devices, but
+        #are not in the cache yet
+        loading = set(self.live_systems.get(other, {}).get(dev_type)
+                      for other in self._system_flight.pending()
+                      for dev_type in self.device_types)
+        for dev_type in self.device_types:
+            dev = subsystem.get(dev_type)
+            if dev is None or id(dev) in in_use or dev.name in loading:
+                continue
+            logger.debug("Releasing %s", dev.name)
+            if self.devices.get(dev.name) is dev:
+                self.devices.pop(dev.name)
+                self._readiness.pop(dev.name, None)
+            teardown_device(dev)
+
+    def cache_info(self):
+        """
+        Statistics of the device cache used by :meth:`.load_device`
+
+        Returns
+        -------
+        info : CacheInfo
+            Named tuple of cache `hits`, `misses` and `currsize`
+        """
+        return CacheInfo(self.device_stats['hits'],
+                         self.device_stats['misses'],
+                         len(self.devices))
+
+    def load_device(self, name, timeout=1, use_cache=True):
+        """
+        Load a device by name from happi
+
+        The happi file is expected to be configured with a `device_class` that
+        matches the necessary class from `pcdsdevices`, as well as information
+        under `args` and `kwargs` that are used to instantiate the device.
+
+        If the device fails to load for any reason, `None` is returned instead.
+        In lazy mode a :class:`.LazyDevice` is returned as long as the device
+        is found in the database
+
+        Parameters
+        ----------
+        name : str
+            Name of the device
+
+        timeout : float, optional
+            Timeout for EPICS signal connections
+
+        use_cache : bool, optional
+            Return a previously loaded device with the same name instead of
+            instantiating a new one. This also ignores any backoff from
+            previous failures. True by default
+
+        Returns
+        -------
+        `pcdsdevices.Device`, :class:`.LazyDevice` or `None`
+
+        """
+        #Reload previously accessed devices
+        with self._lock:
+            if use_cache and name in self.devices:
+                logger.debug("Using cached device %s", name)
+                self.device_stats['hits'] += 1
+                return self.devices[name]
+            self.device_stats['misses'] += 1
+        #Share the result if another thread is already loading the device
+        return self._device_flight.do(name, self._fetch_device, name,
+                                      timeout=timeout, use_cache=use_cache)
+
+    def _fetch_device(self, name, timeout=1, use_cache=True):
+        """
+        Create a device for :meth:`.load_device` and add it to the cache
+        """
+        #The previous load may have finished while we were waiting
+        if use_cache and name in self.devices:
+            return self.devices[name]
+        if self.lazy:
+            dev = self._load_proxy(name, timeout=timeout)
+        else:
+            dev = self._create_device(name, timeout=timeout,
+                                      force=not use_cache)
+        #Cache device for quick recall
+        if dev is not None:
+            with self._lock:
+                #Do not keep a device that already failed in the background
+                if not self._connection_failed(name):
+                    self.devices[name] = dev
+        return dev
+
+    def _load_proxy(self, name, timeout=1):
+        """
+        Create a :class:`.LazyDevice` from the happi information
+        """
+        try:
+            container = self.find_container(name)
+        #Happi failure
+        except happi.errors.SearchError:
+            logger.error("Unable to find device %s in the database",
+                         name)
+            return None
+        return LazyDevice(container, partial(self._create_device, name,
+                                             timeout=timeout))
+
+    def _create_device(self, name, timeout=1, force=False):
+        """
+        Instantiate and connect a device from the happi information
+        """
+        if not force and self._backing_off(name):
+            return None
+        try:
+            #Get device information
+            logger.debug("Loading %s ...", name)
+            dev = self._construct_device(name)
+            if self.background and not self.lazy:
+                self._connect_in_background(name, dev, timeout)
+                return dev
+            #Forget any earlier attempt to connect in the background
+            self._readiness.pop(name, None)
+            self._connect(name, dev, timeout)
+        except Exception as exc:
+            self._report_failure(name, exc)
+            self._record_failure(name)
+            #Do not return anything if we saw an exception
+            return None
+        #Return a device if no exceptions
+        self.failures.pop(name, None)
+        return dev
+
+    def _connect(self, name, dev, timeout=1):
+        """
+        Wait for the signals of a device to connect
+
+        Raises
+        ------
+        TimeoutError:
+            If the signals do not connect in time
+        """
+        with self.report.phase(name, 'connect'):
+            signals = self._manifest_signals(name, dev)
+            #Instantiate all our signals, even if lazy
+            if signals is None:
+                dev.wait_for_connection(all_signals=True,
+                                        timeout=timeout)
+            else:
+                unconnected = wait_for_signals(signals, timeout=timeout)
+                if unconnected:
+                    raise TimeoutError("Signals did not connect: {}"
+                                       "".format(', '.join(unconnected)))
+        self._record_signals(name, dev)
+
+    def _connect_in_background(self, name, dev, timeout=1):
+        """
+        Connect a device in the pool of connection threads, resolving the
+        future returned by :meth:`.ready` once done
+        """
+        future = Future()
+        with self._lock:
+            self._readiness[name] = future
+            if self._connector is None:
+                self._connector = ThreadPoolExecutor(
+                                        max_workers=self.connect_workers)
+
+        def connect():
+            try:
+                self._connect(name, dev, timeout)
+            except Exception as exc:
+                self._report_failure(name, exc)
+                self._record_failure(name)
+                #Mark the failure while holding the lock so the device is not
+                #cached after it has been discarded
+                with self._lock:
+                    self._discard_device(name, dev)
+                    future.set_exception(exc)
+                teardown_device(dev)
+            else:
+                self.failures.pop(name, None)
+                future.set_result(dev)
+
+        self._connector.submit(connect)
+
+    def _discard_device(self, name, dev):
+        """
+        Remove a device that failed to connect, and every system using it,
+        from the caches
+        """
+        with self._lock:
+            if self.devices.get(name) is dev:
+                self.devices.pop(name)
+            for system, subsystem in list(self.cache.items()):
+                if any(subsystem.get(dev_type) is dev
+                       for dev_type in self.device_types):
+                    logger.error("Dropping %s, %s failed to connect",
+                                 system, name)
+                    self.cache.pop(system)
+
+    def _connection_failed(self, name):
+        """
+        Whether the latest background connection of a device failed
+        """
+        future = self._readiness.get(name)
+        return (future is not None and future.done()
+                and future.exception() is not None)
+
+    def ready(self, name):
+        """
+        Find out when a loaded device is connected
+
+        Parameters
+        ----------
+        name : str
+            Name of the device
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Completes with the device once it is connected, or with the
+            exception that stopped it from connecting. Devices that were not
+            loaded in the background are ready as soon as they are loaded
+
+        Raises
+        ------
+        KeyError:
+            If the device has not been loaded
+        """
+        with self._lock:
+            future = self._readiness.get(name)
+            if future is not None:
+                return future
+            dev = self.devices[name]
+        future = Future()
+        future.set_result(dev)
+        return future
+
+    def system_ready(self, system):
+        """
+        Find out when every device of a loaded system is connected
+
+        Parameters
+        ----------
+        system : str
+            Name of the system
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            Completes with the list of devices once all of them are connected,
+            or with the first exception that stopped one from connecting
+
+        Raises
+        ------
+        KeyError:
+            If a device of the system has not been loaded
+        """
+        info = self.live_systems[system]
+        return combine_futures(self.ready(info[dev_type])
+                               for dev_type in self.device_types
+                               if info.get(dev_type) is not None)
+
+    def _backing_off(self, name):
+        """
+        Whether a device failed recently enough that it should not be tried
+        """
+        try:
+            (count, retry_at) = self.failures[name]
+        except KeyError:
+            return False
+        remaining = retry_at - time.monotonic()
+        if remaining > 0:
+            logger.info("Skipping %s after %s failed attempts, retrying in "
+                        "%.0f seconds", name, count, remaining)
+            return True
+        return False
+
+    def _record_failure(self, name):
+        """
+        Remember a failed device and when it should next be attempted
+        """
+        with self._lock:
+            count = self.failures.get(name, (0, 0))[0] + 1
+            delay = min(self.retry_delay * 2 ** (count - 1),
+                        self.max_retry_delay)
+            self.failures[name] = (count, time.monotonic() + delay)
+
+    def retry(self, name=None):
+        """
+        Forget previous failures so devices are attempted on the next request
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of the device. If not given all failures are forgotten
+        """
+        if name is None:
+            self.failures.clear()
+        else:
+            self.failures.pop(name, None)
+
+    def _construct_device(self, name):
+        """
+        Instantiate a device from the happi information without waiting for
+        any connections
+        """
+        self.report.start(name)
+        with self.report.phase(name, 'lookup'):
+            happi_obj = self.find_container(name)
+            info = self.resolved[name]
+        self.report.update(name, device_class=info['device_class'])
+        with self.report.phase(name, 'resolve'):
+            #Grab proper device class
+            device_cls = getattr(pcdsdevices, info['device_class'])
+            #Extra arguments and keywords
+            (_args, _kwargs) = (info[key] for key in ('args', 'kwargs'))
+        with self.report.phase(name, 'construct'):
+            return construct_device(happi_obj,
+                                    device_class=device_cls,
+                                    **_kwargs)
+
+    def _manifest_signals(self, name, dev):
+        """
+        The signals of a device listed in :attr:`.signal_manifests`
+
+        Returns
+        -------
+        signals : list or None
+            Pairs of attribute name and signal, instantiating each signal.
+            `None` if the device class has no manifest, or if any entry of
+            the manifest does not exist on the device, in which case every
+            signal should be connected instead
+        """
+        device_class = self.resolved.get(name, {}).get('device_class')
+        manifest = self.signal_manifests.get(device_class)
+        if manifest is None:
+            return None
+        signals = list()
+        for attr in manifest:
+            try:
+                signals.append((attr, reduce(getattr, attr.split('.'), dev)))
+            except AttributeError:
+                logger.warning("%s has no signal %s, connecting every signal "
+                               "instead", name, attr)
+                return None
+        return signals
+
+    def _record_signals(self, name, dev):
+        """
+        Store the number of signals and connections of a device in the report
+        """
+        try:
+            (total, created, connected) = count_signals(dev)
+        except Exception:
+            logger.debug("Unable to count signals of %s", name, exc_info=True)
+        else:
+            self.report.update(name, signals=total, created=created,
+                               connected=connected)
+
+    def _report_failure(self, name, exc):
+        """
+        Log the reason a device failed to load. Must be called while handling
+        the exception
+        """
+        self.report.update(name, error='{}: {}'.format(type(exc).__name__,
+                                                       exc))
+        #Happi failure
+        if isinstance(exc, happi.errors.SearchError):
+            logger.error("Unable to find device %s in the database",
+                         name)
+        #No proper pcds-devices
+        elif isinstance(exc, AttributeError):
+            logger.exception("Unable to find proper object for %s",
+                             exc)
+        #Catch-all
+        else:
+            logger.exception('Error loading device %s', name)
 
-sim_alignments = {'HOMS': [['sim_m1h', 'sim_m2h']],
-                  'MFX': [['sim_mfx']]}
+    def load_devices(self, names, timeout=1, use_cache=True):
+        """
+        Load a group of devices, waiting for all of their connections at once
 
+        Every device is instantiated before any connections are waited on, so
+        all of the signals of all of the devices connect in parallel against a
+        single shared deadline, rather than each device waiting in turn
 
-class ConfigReader:
-    """
-    Device to store and load devices neccesary for alignment
+        Parameters
+        ----------
+        names : list of str
+            Names of the devices to load
 
-    The configuration is dependent on two seperate JSON files. The first of
-    which is the standard configuration file created by the `JSONBackend` for
-    happi. This contains all the necessary devices for alignment. The second of
-    which is a JSON file that contains all the device names grouped into single
-    subsystems consisting of a slit, a mirror, an imager, and a rotation for
-    the YAG.
+        timeout : float, optional
+            Total time to wait for every signal to connect
 
-    At initialization the system names and mapping are loaded into the
-    ConfigReader, then a user can request that a subsystem be loaded by using
-    :meth:`.get_subystem`. This looks in the system description for each child
-    devices name, requests the child device's information in happi and
-    instantiates the correct pcdsdevice. Once this has been done in happi,
-    subsequent requests will simply returned cached value as to avoid
-    unnecessary device creation.
+        use_cache : bool, optional
+            Return previously loaded devices instead of instantiating new
+            ones. True by default
 
-    Parameters
-    ----------
-    happi_json : str
-        Path to JSON file that contains happi information
+        Returns
+        -------
+        devices : list
+            Loaded devices in the same order as `names`. Devices that could
+            not be created or did not connect are `None`
 
-    system_json : str
-        Path to JSON file that holds device names to load from happi
-    """
-    device_types = ['mirror', 'imager', 'slits']
-    info_swap    = {'mirror' : {'states' : 'prefix_xy'},
-                    'imager' : {'data'   : 'prefix_det'}}
-    def __init__(self, happi_json, system_json):
-        #Load happi client
-        self.client  = happi.Client(database=JSONBackend(happi_json))
-        #Load system information
-        self.live_systems = simplejson.load(open(system_json, 'r'))
-        #Create cache of previously loaded devices
-        self.cache = {}
+        failures : dict
+            Names of the signals that did not connect, keyed by device name
+        """
+        devices = dict()
+        created = dict()
+        #Create all of the devices first
+        for name in names:
+            if name in devices or name in created:
+                continue
+            with self._lock:
+                if use_cache and name in self.devices:
+                    self.device_stats['hits'] += 1
+                    devices[name] = self.devices[name]
+                    continue
+                self.device_stats['misses'] += 1
+            if use_cache and self._backing_off(name):
+                devices[name] = None
+                continue
+            try:
+                logger.debug("Creating %s ...", name)
+                created[name] = self._construct_device(name)
+            except Exception as exc:
+                self._report_failure(name, exc)
+                self._record_failure(name)
+                devices[name] = None
+        #Kickstart the signals of each manifest, or every signal if there is
+        #none, even if lazy
+        pending = dict()
+        for name, dev in created.items():
+            try:
+                signals = self._manifest_signals(name, dev)
+                if signals is None:
+                    signals = walk_signals(dev)
+                for attr, sig in signals:
+                    pending[(name, attr)] = sig
+            except Exception as exc:
+                self._report_failure(name, exc)
+                self._record_failure(name)
+                devices[name] = None
+        #Wait for all of them together
+        signal_counts = Counter(name for (name, attr) in pending)
+        waiting = set(signal_counts)
+        start = time.time()
+        deadline = start + timeout
+        while True:
+            pending = dict((key, sig) for key, sig in pending.items()
+                           if not sig.connected)
+            #Note when each device finished connecting
+            remaining = set(name for (name, attr) in pending)
+            for name in waiting - remaining:
+                self.report.update(name, connect=time.time() - start)
+            waiting = remaining
+            if not pending or time.time() >= deadline:
+                break
+            time.sleep(min(0.05, timeout / 10.))
+        failures = dict()
+        for (name, attr) in sorted(pending):
+            failures.setdefault(name, list()).append(attr)
+        for name in signal_counts:
+            self._record_signals(name, created[name])
+        for name, attrs in failures.items():
+            logger.error("Failed to connect %s signals: %s", name,
+                         ', '.join(attrs))
+            self.report.update(name, connect=time.time() - start,
+                               error='Unconnected signals: {}'
+                                     ''.format(', '.join(attrs)))
+            self._record_failure(name)
+            devices[name] = None
+        #Close the channels of every device that failed
+        for name, dev in created.items():
+            if name in devices:
+                teardown_device(dev)
+        #Cache devices for quick recall
+        for name, dev in created.items():
+            if name not in devices:
+                with self._lock:
+                    cached = self.devices.get(name)
+                    if cached is None or not use_cache:
+                        self.devices[name] = dev
+                    self.failures.pop(name, None)
+                #Another thread loaded the same device in the meantime
+                if use_cache and cached is not None:
+                    teardown_device(dev)
+                    dev = cached
+                devices[name] = dev
+        return [devices[name] for name in names], failures
 
-    @property
-    def available_systems(self):
+    def load_configuration(self, timeout=1, max_workers=None, deadline=None,
+                           beamline=None, z_range=None, upstream_of=None):
         """
-        All systems the ConfigReader has available mappings
+        Load the entire configuration
+
+        In order to still represent devices in the lightpath that fail to load,
+        if a device fails on intialization the happi container is returned
+        instead.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Timeout for EPICS signal connections
+
+        max_workers : int, optional
+            Number of threads used to load devices concurrently. By default,
+            devices are loaded one after another
+
+        deadline : float, optional
+            Total time to wait for a concurrent load. Devices that have not
+            finished by then are returned as failed containers. Ignored unless
+            `max_workers` is given
+
+        beamline, z_range, upstream_of : optional
+            Only load the devices selected by :meth:`.select_devices`
+
+        Returns
+        -------
+        pcdsdevices: list
+            List of properly instantiated pcdsdevices
+
+        containers : list
+            List of happi containers that failed to load
         """
-        return list(self.live_systems.keys())
+        #Load devices
+        devices = list()
+        containers = list()
+        logger.info("Loading LCLS Lightpath devices ...")
+        #Create the devices
+        active = self._active_containers(beamline=beamline, z_range=z_range,
+                                         upstream_of=upstream_of)
+        names = [container.name for container in active]
+        if max_workers:
+            loaded = self._load_concurrently(names, timeout=timeout,
+                                             max_workers=max_workers,
+                                             deadline=deadline)
+        else:
+            loaded = [self.load_device(name, timeout=timeout)
+                      for name in names]
+        #Add to our list
+        for container, dev in zip(active, loaded):
+            if dev is not None:
+                devices.append(dev)
+            else:
+                containers.append(container)
+        #Return a list of devices
+        return devices, containers
 
-    def get_systems_with(self, key):
+    def iter_configuration(self, timeout=1, max_workers=None, deadline=None,
+                           beamline=None, z_range=None, upstream_of=None):
         """
-        Get the systems that include the given device name.
+        Load the configuration, yielding each device as soon as it is ready
+
+        This allows an application to start displaying devices while the rest
+        of the configuration is still connecting. When devices are loaded
+        concurrently they are produced in the order that they finish. Closing
+        the generator early stops any devices that have not started loading
 
         Parameters
         ----------
-        key : str
-            Name of a device
+        timeout : float, optional
+            Timeout for EPICS signal connections
+
+        max_workers : int, optional
+            Number of threads used to load devices concurrently. By default,
+            devices are loaded one after another
+
+        deadline : float, optional
+            Total time to wait for a concurrent load. Devices that have not
+            finished by then are yielded as failures. Ignored unless
+            `max_workers` is given
+
+        beamline, z_range, upstream_of : optional
+            Only load the devices selected by :meth:`.select_devices`
+
+        Yields
+        ------
+        container, device : happi.Device, `pcdsdevices.Device` or `None`
+            Happi container and the loaded device, or `None` if the device
+            failed to load
+        """
+        logger.info("Loading LCLS Lightpath devices ...")
+        active = self._active_containers(beamline=beamline, z_range=z_range,
+                                         upstream_of=upstream_of)
+        if not max_workers:
+            for container in active:
+                yield container, self.load_device(container.name,
+                                                  timeout=timeout)
+            return
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        futures = dict((pool.submit(self.load_device, container.name,
+                                    timeout=timeout), container)
+                       for container in active)
+        finished = set()
+        try:
+            try:
+                for future in as_completed(futures, timeout=deadline):
+                    finished.add(future)
+                    yield futures[future], future.result()
+            except FutureTimeout:
+                for future, container in futures.items():
+                    if future not in finished:
+                        logger.error("Timed out waiting for %s to load",
+                                     container.name)
+                        future.cancel()
+                        yield container, None
+        finally:
+            #Make sure nothing new starts if we were closed early
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+
+    def select_devices(self, beamline=None, z_range=None, upstream_of=None):
+        """
+        Get the names of the devices in part of the facility
+
+        Each selection narrows the result, so combining them returns only the
+        devices that satisfy all of them. With no selection every device is
+        returned
+
+        Parameters
+        ----------
+        beamline : str or list of str, optional
+            Only devices on these beamlines
+
+        z_range : tuple, optional
+            Minimum and maximum z of the devices. Either bound may be `None`
+
+        upstream_of : str, optional
+            Only the devices the beam passes through on its way to this hutch.
+            This is every device on the beamline of the hutch, as well as the
+            devices on the beamlines listed in :attr:`.upstream_beamlines` with
+            a z no further than the last device of the hutch
 
         Returns
         -------
-        systems : list of str
-            A list of systems that include the given device.
+        names : list of str
         """
-        try:
-            return self.systems_with_dict[key]
-        except KeyError:
-            return []
-        except AttributeError:
-            d = {}
-            for system, components in self.live_systems.items():
-                for name in components.values():
-                    if isinstance(name, str):
-                        d[name] = d.get(name, []) + [system]
-            self.systems_with_dict = d
-            return self.get_systems_with(key)
+        names = list(self.documents)
+        if beamline is not None:
+            if isinstance(beamline, str):
+                beamline = [beamline]
+            selected = set()
+            for line in beamline:
+                selected.update(self.beamline_index.get(line, []))
+            names = [name for name in names if name in selected]
+        if z_range is not None:
+            (zmin, zmax) = z_range
+            names = [name for name in names
+                     if self._within(self.documents[name].get('z'),
+                                     zmin, zmax)]
+        if upstream_of is not None:
+            hutch = upstream_of.upper()
+            if hutch not in self.upstream_beamlines:
+                logger.warning("No upstream beamlines configured for %s, "
+                               "only selecting devices on its own beamline",
+                               hutch)
+            own = set(self.beamline_index.get(hutch, []))
+            zs = [self.documents[name].get('z') for name in own]
+            zs = [z for z in zs if z is not None]
+            zmax = max(zs) if zs else None
+            upstream = set()
+            if zmax is not None:
+                for line in self.upstream_beamlines.get(hutch, []):
+                    for name in self.beamline_index.get(line, []):
+                        z = self.documents[name].get('z')
+                        if self._within(z, None, zmax):
+                            upstream.add(name)
+            names = [name for name in names
+                     if name in own or name in upstream]
+        return names
 
-    def get_subsystem(self, system, timeout=30, use_cache=True):
+    @staticmethod
+    def _within(z, zmin, zmax):
         """
-        Load the pcdsdevices corresponding to a system name
+        Whether a z position is inside the given bounds
+        """
+        if z is None:
+            return False
+        return ((zmin is None or z >= zmin)
+                and (zmax is None or z <= zmax))
+
+    def _active_containers(self, **scope):
+        """
+        All of the happi containers marked as active, limited by the keywords
+        given to :meth:`.select_devices`
+        """
+        active = list()
+        for name in self.select_devices(**scope):
+            container = self.find_container(name)
+            if not container.active:
+                logger.debug("Ignore inactive device %s", container.name)
+                continue
+            active.append(container)
+        return active
+
+    def _load_concurrently(self, names, timeout=1, max_workers=None,
+                           deadline=None, use_cache=True):
+        """
+        Load a group of devices from a pool of threads
+
+        Parameters
+        ----------
+        names : list of str
+            Names of devices to load
+
+        timeout : float, optional
+            Timeout for EPICS signal connections of each device
+
+        max_workers : int, optional
+            Size of the thread pool
+
+        deadline : float, optional
+            Total time to wait for all of the devices
+
+        use_cache : bool, optional
+            Return previously loaded devices instead of instantiating new ones
+
+        Returns
+        -------
+        devices : list
+            Loaded devices in the same order as `names`. Devices that failed
+            or did not finish before the deadline are `None`
+        """
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        futures = [pool.submit(self.load_device, name, timeout=timeout,
+                               use_cache=use_cache)
+                   for name in names]
+        done, pending = wait(futures, timeout=deadline)
+        #Do not start anything new once the deadline has passed. Threads
+        #already blocked on a connection are left to finish on their own
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=False)
+        devices = list()
+        for name, future in zip(names, futures):
+            if future in done:
+                devices.append(future.result())
+            else:
+                logger.error("Timed out waiting for %s to load", name)
+                devices.append(None)
+        return devices
+
+    async def async_load_device(self, name, timeout=1, use_cache=True):
+        """
+        Coroutine version of :meth:`.load_device`
+
+        The device is created in the default executor of the running event
+        loop so that many devices can wait for their connections at the same
+        time. Cancelling the coroutine stops the wait, however the thread
+        already loading the device is allowed to finish in the background
+
+        Parameters
+        ----------
+        name : str
+            Name of the device
+
+        timeout : float, optional
+            Timeout for EPICS signal connections
+
+        use_cache : bool, optional
+            Return a previously loaded device with the same name. True by
+            default
+
+        Returns
+        -------
+        `pcdsdevices.Device` or `None`
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(self.load_device,
+                                                        name,
+                                                        timeout=timeout,
+                                                        use_cache=use_cache))
+
+    async def async_get_subsystem(self, system, timeout=1, use_cache=True):
+        """
+        Coroutine version of :meth:`.get_subsystem`
+
+        All of the child devices of the system are loaded concurrently. If any
+        of them fail to load the system is abandoned and not cached
 
         Parameters
         ----------
@@ -138,124 +2103,99 @@ class ConfigReader:
             Name of subsystem to load
 
         timeout : float, optional
-            Timeout for devices
+            Timeout for EPICS signal connections of each device
 
         use_cache : bool, optional
             Search the cache for previously loaded devices before instantiating
             new ones. True by default
+
         Returns
         -------
         subsystem : dict
             Dictionary containing keys for mirror, imager, slits and rotation
         """
         #Reload previously accessed systems
-        if system in self.cache and use_cache:
+        cached = self.cache.get(system) if use_cache else None
+        if cached is not None:
             logger.debug("Using cached devices for %s", system)
-            return self.cache[system]
+            return cached
+        #Wait for another load of the same system
+        future, leader = self._system_flight.claim(system)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        #The previous load may have finished while we were claiming
+        cached = self.cache.get(system) if use_cache else None
+        if cached is not None:
+            self._system_flight.finish(system, result=cached)
+            return cached
+        try:
+            system_objs = await self._async_load_system(system, timeout,
+                                                        use_cache)
+        except BaseException as exc:
+            self._system_flight.finish(system, exception=exc)
+            raise
+        self._system_flight.finish(system, result=system_objs)
+        return system_objs
 
+    async def _async_load_system(self, system, timeout, use_cache):
+        """
+        Load and cache the devices of a system for
+        :meth:`.async_get_subsystem`
+        """
         if system not in self.available_systems:
             logger.error("No system information found for %s", system)
 
         #Create new system
         logger.info("Loading necessary device information from database")
-        system_objs  = dict.fromkeys(self.device_types)
+        system_objs = dict.fromkeys(self.device_types)
         #Get information from system names
         try:
+            names = list()
             for dev_type in self.device_types:
-                #Get device name
-                name = self.live_systems[system][dev_type]
-                dev  = self.load_device(name)
-                #Report if we did not recieve a device
-                if not dev:
-                    raise ValueError
-                #Store in system obj
-                system_objs[dev_type] = dev
-            system_objs['rotation'] = self.live_systems[system]['rotation']
-
+                names.append(self.live_systems[system][dev_type])
+            rotation = self.live_systems[system]['rotation']
         #System JSON failure
         except KeyError:
             logger.error("System %s does not have a %s object registered",
                           system, dev_type)
-        except ValueError:
+            return system_objs
+        #Load all of the children at once
+        loads = [self.async_load_device(name, timeout=timeout,
+                                        use_cache=use_cache)
+                 for name in names]
+        devices = await asyncio.gather(*loads)
+        system_objs.update(zip(self.device_types, devices))
+        #Report if we did not recieve a device
+        if not all(devices):
             logger.error("Abandoning configuration load for %s",
                          system)
+            return system_objs
+        system_objs['rotation'] = rotation
         #Cache system for quick recall
-        else:
-            self.cache[system] = system_objs
-
+        self._cache_system(system, dict(zip(self.device_types, names)),
+                           system_objs)
         return system_objs
 
-    def __getitem__(self, key):
-        return self.cache.get(key, None)
-
-    def load_device(self, name, timeout=1):
+    async def async_load_configuration(self, timeout=1, deadline=None,
+                                       beamline=None, z_range=None,
+                                       upstream_of=None):
         """
-        Load a device by name from happi
-
-        The happi file is expected to be configured with a `device_class` that
-        matches the necessary class from `pcdsdevices`, as well as information
-        under `args` and `kwargs` that are used to instantiate the device.
+        Coroutine version of :meth:`.load_configuration`
 
-        If the device fails to load for any reason, `None` is returned instead
+        Every active device is loaded concurrently. Devices that have not
+        finished loading by the deadline are cancelled and returned as failed
+        containers
 
         Parameters
         ----------
-        name : str
-            Name of the device
-
         timeout : float, optional
-            Timeout for EPICS signal connections
-
-        Returns
-        -------
-        `pcdsdevices.Device` or `None`
+            Timeout for EPICS signal connections of each device
 
-        """
-        try:
-            #Get device information
-            logger.debug("Loading %s ...", name)
-            happi_obj = self.client.load_device(name=name)
-            #Grab proper device class
-            device_cls = getattr(pcdsdevices,
-                                 happi_obj.extraneous['device_class'])
-            #Extra arguments and keywords
-            (_args, _kwargs) = (happi_obj.extraneous.get(key)
-                                for key in ('args', 'kwargs'))
-            dev = construct_device(happi_obj,
-                                   device_class=device_cls,
-                                   **_kwargs)
-            #Instantiate all our signals, even if lazy
-            dev.wait_for_connection(all_signals=True,
-                                    timeout=timeout)
-        #Happi failure
-        except happi.errors.SearchError:
-            logger.error("Unable to find device %s in the database",
-                         name)
-        #No proper pcds-devices
-        except AttributeError as exc:
-            logger.exception("Unable to find proper object for %s",
-                             exc)
-        #Catch-all
-        except Exception:
-            logger.exception('Error loading device %s', name)
-        #Return a device if no exceptions
-        else:
-            return dev
-        #Do not return anything if we saw an exception
-        return None
-
-    def load_configuration(self, timeout=1):
-        """
-        Load the entire configuration
-
-        In order to still represent devices in the lightpath that fail to load,
-        if a device fails on intialization the happi container is returned
-        instead.
+        deadline : float, optional
+            Total time to wait for the configuration
 
-        Parameters
-        ----------
-        timeout : float, optional
-            Timeout for EPICS signal connections
+        beamline, z_range, upstream_of : optional
+            Only load the devices selected by :meth:`.select_devices`
 
         Returns
         -------
@@ -265,33 +2205,62 @@ class ConfigReader:
         containers : list
             List of happi containers that failed to load
         """
-        #Load devices
         devices = list()
         containers = list()
         logger.info("Loading LCLS Lightpath devices ...")
-        #Iterate through all the devices
-        for container in self.client.all_devices:
-            #Create a device
-            if not container.active:
-                logger.debug("Ignore inactive device %s", container.name)
-                continue
-
-            dev = self.load_device(container.name,
-                                   timeout=timeout)
+        active = self._active_containers(beamline=beamline, z_range=z_range,
+                                         upstream_of=upstream_of)
+        tasks = [asyncio.ensure_future(self.async_load_device(container.name,
+                                                              timeout=timeout))
+                 for container in active]
+        if tasks:
+            try:
+                done, pending = await asyncio.wait(tasks, timeout=deadline)
+            #Do not leave orphaned loads if we are cancelled ourselves
+            except asyncio.CancelledError:
+                for task in tasks:
+                    task.cancel()
+                raise
+            for task in pending:
+                task.cancel()
+        for container, task in zip(active, tasks):
+            if task.done() and not task.cancelled():
+                dev = task.result()
+            else:
+                logger.error("Timed out waiting for %s to load",
+                             container.name)
+                dev = None
             #Add to our list
             if dev is not None:
                 devices.append(dev)
             else:
                 containers.append(container)
-        #Return a list of devices
         return devices, containers
 
 
 class SimConfigReader(ConfigReader):
-    def __init__(self):
+    """
+    Stand-in for :class:`.ConfigReader` serving simulated devices
+
+    Parameters
+    ----------
+    n_mirrors : int, optional
+        Create a beamline of this size with :func:`.build_sim_beamline`
+        instead of using the default simulated beamline
+
+    layout : kwargs
+        Passed to :func:`.build_sim_beamline`
+    """
+    def __init__(self, n_mirrors=None, **layout):
         self.client = None
         self.live_systems = {}
         self._devs = {}
+        if n_mirrors is None:
+            sim_config = get_sim_config()
+            self.alignments = sim_alignments
+        else:
+            sim_config, self.alignments = build_sim_beamline(n_mirrors,
+                                                             **layout)
         for sysname, info in sim_config.items():
             self.live_systems[sysname] = {}
             for devstr, device in info.items():
@@ -302,12 +2271,78 @@ class SimConfigReader(ConfigReader):
                 self.live_systems[sysname][devstr] = name
                 self._devs[name] = device
         self.cache = sim_config
+        self.devices = self._devs
+        self.device_stats = Counter()
+        self.failures = {}
+        self.report = LoadReport()
+        self.documents = {}
+        self.build_indexes()
+        self._lock = threading.RLock()
+        self._readiness = {}
+        self._reload_callbacks = list()
+
+    def pin(self, systems):
+        pass
+
+    def add_evict_callback(self, callback):
+        pass
+
+    def has_changed(self):
+        return False
+
+    def reload(self, force=False):
+        return None
 
     def get_subsystem(self, system, *args, **kwargs):
         return self.cache[system]
 
+    def get_subsystems(self, systems, *args, **kwargs):
+        return dict((system, self.cache[system]) for system in systems)
+
     def load_device(self, name, *args, **kwargs):
         return self._devs[name]
 
-    def load_configuration(self):
+    def load_configuration(self, *args, **kwargs):
         return list(self._devs.values()), []
+
+    def find_container(self, name=None, prefix=None):
+        """
+        Happi container describing a simulated device
+
+        Simulated devices are not in a database, so the container is made
+        from the device itself the first time it is requested
+        """
+        if name is None:
+            names = [dev.name for dev in self._devs.values()
+                     if getattr(dev, 'prefix', None) == prefix]
+            if not names:
+                raise happi.errors.SearchError("No device found with prefix "
+                                               "{}".format(prefix))
+            name = names[0]
+        try:
+            return self.container_index[name]
+        except KeyError:
+            pass
+        try:
+            device = self._devs[name]
+        except KeyError:
+            raise happi.errors.SearchError("No device found with name {}"
+                                           "".format(name))
+        container = happi.Device(name=device.name,
+                                 prefix=getattr(device, 'prefix', ''),
+                                 active=True,
+                                 device_class=type(device).__name__)
+        return self.container_index.setdefault(name, container)
+
+    def iter_configuration(self, *args, **kwargs):
+        for device in self._devs.values():
+            yield self.find_container(device.name), device
+
+    async def async_get_subsystem(self, system, *args, **kwargs):
+        return self.get_subsystem(system)
+
+    async def async_load_device(self, name, *args, **kwargs):
+        return self.load_device(name)
+
+    async def async_load_configuration(self, *args, **kwargs):
+        return self.load_configuration()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Persistent storage of parsed configuration information
+
+Parsing the happi database and resolving every entry is repeated each time an
+application is launched even though the configuration files rarely change. A
+:class:`.MetadataCache` stores the parsed result on disk alongside a
+fingerprint of each source file, and refuses to return anything once any of
+the sources differ from the ones used to create it.
+"""
+import os
+import os.path
+import pickle
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+#Increment whenever the layout of the stored information changes
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'skywalker')
+
+
+def file_digest(path):
+    """
+    SHA1 hash of the contents of a file
+    """
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def atomic_write(path, write, mode='w'):
+    """
+    Write a file so that readers never see it partially written
+
+    The contents go to a temporary file in the same directory, which then
+    replaces `path`
+
+    Parameters
+    ----------
+    path : str
+        Destination of the file
+
+    write : callable
+        Called with the open temporary file to write the contents
+
+    mode : str, optional
+        Mode used to open the temporary file
+    """
+    tmp = path + '.{}.tmp'.format(os.getpid())
+    try:
+        with open(tmp, mode) as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def fingerprint(path, digest=True):
+    """
+    Information used to decide whether a file has changed
+
+    Parameters
+    ----------
+    path : str
+        Path to the file
+
+    digest : bool, optional
+        Include a hash of the file contents
+
+    Returns
+    -------
+    fingerprint : dict
+        Modification time, size and optionally the hash of the file
+    """
+    stat = os.stat(path)
+    info = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+    if digest:
+        info['sha1'] = file_digest(path)
+    return info
+
+
+class MetadataCache:
+    """
+    Versioned, on-disk store of information derived from configuration files
+
+    The stored information is keyed by the modification time and size of each
+    source file. If those do not match, the contents are hashed and compared
+    so that a file that was only touched does not invalidate the cache.
+
+    Parameters
+    ----------
+    sources : list of str
+        Paths of the files the cached information is derived from
+
+    cache_dir : str, optional
+        Directory to store the cache. One cache file is kept for each unique
+        set of sources
+    """
+    def __init__(self, sources, cache_dir=DEFAULT_CACHE_DIR):
+        self.sources = [os.path.abspath(source) for source in sources]
+        key = hashlib.sha1('\n'.join(self.sources).encode()).hexdigest()
+        self.path = os.path.join(cache_dir, 'metadata-{}.pkl'.format(key[:16]))
+
+    def load(self):
+        """
+        Load the cached information
+
+        Returns
+        -------
+        data : dict or None
+            Information stored by :meth:`.save`, or `None` if there is no
+            valid cache for the current state of the sources
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                stored = pickle.load(f)
+        except FileNotFoundError:
+            logger.debug("No cached metadata found at %s", self.path)
+            return None
+        except Exception:
+            logger.warning("Unable to read cached metadata from %s",
+                           self.path)
+            return None
+        if stored.get('version') != CACHE_VERSION:
+            logger.debug("Ignoring cached metadata from an older version")
+            return None
+        stale = False
+        fingerprints = dict()
+        for source in self.sources:
+            cached = stored['sources'].get(source)
+            try:
+                current = fingerprint(source, digest=False)
+            except OSError:
+                return None
+            if cached is None:
+                return None
+            fingerprints[source] = dict(current, sha1=cached['sha1'])
+            #Quick check on the file statistics
+            if all(cached[key] == current[key] for key in current):
+                continue
+            #Fall back to checking the contents
+            if cached['sha1'] != file_digest(source):
+                logger.info("%s has changed, ignoring cached metadata",
+                            source)
+                return None
+            stale = True
+        #Refresh the file statistics so the next load is fast
+        if stale:
+            self.save(stored['data'], fingerprints)
+        logger.debug("Using cached metadata from %s", self.path)
+        return stored['data']
+
+    def fingerprints(self):
+        """
+        Fingerprint of each source
+
+        Take these before reading the sources and pass them to :meth:`.save`,
+        so that an edit made while the files are parsed is not mistaken for
+        the version that was read
+
+        Returns
+        -------
+        fingerprints : dict
+            Result of :func:`.fingerprint` keyed by source
+        """
+        return dict((source, fingerprint(source)) for source in self.sources)
+
+    def save(self, data, fingerprints=None):
+        """
+        Store information derived from the sources
+
+        Parameters
+        ----------
+        data : dict
+            Picklable information to store
+
+        fingerprints : dict, optional
+            Result of :meth:`.fingerprints` from before the sources were
+            read. Taken now if not given
+        """
+        try:
+            if fingerprints is None:
+                fingerprints = self.fingerprints()
+            stored = {'version': CACHE_VERSION,
+                      'sources': fingerprints,
+                      'data': data}
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            atomic_write(self.path,
+                         lambda f: pickle.dump(stored, f,
+                                               pickle.HIGHEST_PROTOCOL),
+                         mode='wb')
+        except Exception:
+            logger.warning("Unable to save metadata cache to %s", self.path)
+        else:
+            logger.debug("Saved metadata cache to %s", self.path)
+
+    def clear(self):
+        """
+        Remove the stored information
+        """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
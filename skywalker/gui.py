@@ -7,14 +7,12 @@ from threading import RLock
 
 import simplejson as json
 
-from bluesky import RunEngine
-from bluesky.utils import install_qt_kicker
 from bluesky.preprocessors import run_wrapper, stage_wrapper
 
 from pydm import Display
 from pydm.PyQt.QtCore import (pyqtSlot, pyqtSignal,
                               QCoreApplication,
-                              QObject, QEvent)
+                              QObject, QEvent, QTimer)
 from pydm.PyQt.QtGui import QDoubleValidator, QDialog
 
 from pcdsdevices.epics.attenuator import FeeAtt
@@ -23,8 +21,12 @@ from pswalker.suspenders import (BeamEnergySuspendFloor,
                                  BeamRateSuspendFloor)
 from pswalker.skywalker import skywalker
 
-from skywalker.config import ConfigReader, SimConfigReader, sim_alignments
+from skywalker.config import ConfigReader, SimConfigReader
+from skywalker.diskcache import DEFAULT_CACHE_DIR
 from skywalker.logger import GuiHandler
+from skywalker.prefetch import Prefetcher
+from skywalker.runner import PlanRunner, LatencyMonitor
+from skywalker.service import DEFAULT_SOCKET
 from skywalker.utils import ad_stats_x_axis_rot
 from skywalker.settings import Setting, SettingsGroup
 from skywalker.widgetgroup import (ObjWidgetGroup, ValueWidgetGroup,
@@ -32,6 +34,8 @@ from skywalker.widgetgroup import (ObjWidgetGroup, ValueWidgetGroup,
 
 logger = logging.getLogger(__name__)
 MAX_MIRRORS = 2
+CONFIG_POLL_MS = 2000
+SYSTEM_CACHE_SIZE = 8
 
 
 class SkywalkerGui(Display):
@@ -50,10 +54,17 @@ class SkywalkerGui(Display):
     dark : bool, optional
         Choice to launch the application with a dark stylesheet
 
+    plan_thread : bool, optional
+        Run the alignments in a separate thread rather than on the GUI thread
+
     parent : QWidget
         Parent Widget of application
     """
-    def __init__(self, parent=None, live=False, cfg=None,  dark=True):
+    # Emitted from the connection threads with the name of a device
+    device_ready = pyqtSignal(str)
+
+    def __init__(self, parent=None, live=False, cfg=None,  dark=True,
+                 plan_thread=True):
         super().__init__(parent=parent)
         ui = self.ui
 
@@ -90,10 +101,9 @@ class SkywalkerGui(Display):
         ui.image_title_combo.clear()
         ui.procedure_combo.clear()
         ui.procedure_combo.addItem('None')
-        self.all_imager_names = [entry['imager'] for entry in
-                                 self.loader.live_systems.values()]
-        for imager_name in self.all_imager_names:
-            ui.image_title_combo.addItem(imager_name)
+        self.all_imager_names = []
+        self.imager_index = {}
+        self.update_imager_combo()
         for align in self.alignments.keys():
             ui.procedure_combo.addItem(align)
 
@@ -106,7 +116,11 @@ class SkywalkerGui(Display):
 
         # self.procedure and self.image_obj keep track of the gui state
         self.procedure = 'None'
+        self.imager_system = first_system_key
         self.image_obj = first_imager
+        self.image_rotation = first_rotation
+        # Keep the displayed system loaded however many others are loaded
+        self.pin_systems()
 
         # Initialize slit readback
         self.slit_group = ObjWidgetGroup([ui.slit_x_width,
@@ -168,7 +182,8 @@ class SkywalkerGui(Display):
             self.goals_groups.append(goal_group)
 
         # Initialize image and centroids. Needs goals defined first.
-        self.image_group = ImgObjWidget(ui.image, first_imager,
+        # The imager is swapped in by update_ready once it has connected.
+        self.image_group = ImgObjWidget(ui.image, None,
                                         ui.beam_x_value, ui.beam_y_value,
                                         ui.beam_x_delta, ui.beam_y_delta,
                                         ui.image_state,
@@ -201,22 +216,23 @@ class SkywalkerGui(Display):
         self.cache_settings()  # Required in case nothing is loaded
 
         # Create the RunEngine that will be used in the alignments.
-        # This gives us the ability to pause, etc.
-        self.RE = RunEngine({})
-        install_qt_kicker()
-
-        # Some hax to keep the state string updated
-        # There is probably a better way to do this
-        # This might break on some package update
-        self.RE.state  # Yes this matters
-        old_set = RunEngine.state._memory[self.RE].set_
-        def new_set(state):  # NOQA
-            old_set(state)
-            txt = " Status: " + state.capitalize()
-            self.ui.status_label.setText(txt)
-        RunEngine.state._memory[self.RE].set_ = new_set
+        # This gives us the ability to pause, etc. The runner keeps it off
+        # the GUI thread so the image and readbacks stay live.
+        self.runner = PlanRunner(threaded=plan_thread)
+        self.RE = self.runner.RE
+        self.runner.state_changed.connect(self.on_state_changed)
+        self.runner.job_finished.connect(self.on_job_finished)
+        self.runner.start()
+        self.busy = False
+
+        # Record how responsive we stay during each procedure
+        self.latency = LatencyMonitor(parent=self)
 
         # Connect relevant signals and slots
+        self.device_ready.connect(self.update_ready)
+        for obj in (first_imager, first_slit):
+            self.watch_ready(obj)
+
         procedure_changed = ui.procedure_combo.currentIndexChanged[str]
         procedure_changed.connect(self.on_procedure_combo_changed)
 
@@ -254,6 +270,13 @@ class SkywalkerGui(Display):
 
         self.cam_lock = RLock()
 
+        # Pick up edits to the configuration files
+        self.loader.add_reload_callback(self.on_config_reloaded)
+        if not self.sim:
+            self.reload_timer = QTimer(self)
+            self.reload_timer.timeout.connect(self.on_reload_timer)
+            self.reload_timer.start(CONFIG_POLL_MS)
+
         # Store some info about our screen size.
         QApp = QCoreApplication.instance()
         desktop = QApp.desktop()
@@ -270,10 +293,23 @@ class SkywalkerGui(Display):
         # Setup the on-screen logger
         console = self.setup_gui_logger()
 
+        # Load every other system in the background
+        self.prefetcher = Prefetcher(self.loader, self.prefetch_order())
+        self.prefetcher.progress.connect(self.on_prefetch_progress)
+        self.prefetcher.stopped.connect(self.on_prefetch_stopped)
+        self.prefetcher.start()
+
         # Stop the run if we get closed
-        close_dict = dict(RE=self.RE, console=console)
+        close_dict = dict(runner=self.runner, console=console,
+                          prefetcher=self.prefetcher)
         self.destroyed.connect(partial(SkywalkerGui.on_close, close_dict))
 
+        # Show whatever has connected already
+        self.update_ready()
+
+        # Record which devices slowed down the startup
+        self.loader.report.log_summary(level=logging.DEBUG)
+
         # Put out the initialization message.
         init_base = 'Skywalker GUI initialized in '
         if self.sim:
@@ -291,6 +327,7 @@ class SkywalkerGui(Display):
         self.happi_config = self.get_cfg_path('metadata')
         self.system_config = self.get_cfg_path('system')
         self.alignment_config = self.get_cfg_path('alignments')
+        self.compiled_config = self.get_cfg_path('compiled')
 
         # Load files needed during __init__
         self.load_system()
@@ -305,11 +342,21 @@ class SkywalkerGui(Display):
         if self.sim:
             self.loader = SimConfigReader()
         else:
-            self.loader = ConfigReader(self.happi_config, self.system_config)
+            # Prefer the output of skywalker-compile-config if there is one
+            artifact = None
+            if path.exists(self.compiled_config):
+                artifact = self.compiled_config
+            self.loader = ConfigReader(self.happi_config, self.system_config,
+                                       cache_dir=DEFAULT_CACHE_DIR,
+                                       cache_size=SYSTEM_CACHE_SIZE,
+                                       artifact=artifact,
+                                       service=DEFAULT_SOCKET,
+                                       background=True)
+        self.loader.add_evict_callback(self.on_system_evicted)
 
     def load_alignments(self):
-        if self.sim:
-            self.alignments = sim_alignments
+        if self.sim or self.loader.alignments is not None:
+            self.alignments = self.loader.alignments
         else:
             with open(self.alignment_config, 'r') as f:
                 d = json.load(f)
@@ -325,11 +372,13 @@ class SkywalkerGui(Display):
     # the object instance is already completely gone
     @staticmethod
     def on_close(close_dict):
-        RE = close_dict['RE']
+        runner = close_dict['runner']
         console = close_dict['console']
+        prefetcher = close_dict['prefetcher']
         console.close()
-        if RE.state != 'idle':
-            RE.abort()
+        prefetcher.requestInterruption()
+        prefetcher.wait()
+        runner.stop()
 
     def setup_gui_logger(self):
         """
@@ -344,6 +393,105 @@ class SkywalkerGui(Display):
         logging.getLogger('').addHandler(console)
         return console
 
+    def prefetch_order(self):
+        """
+        Every system used in an alignment procedure, starting with the systems
+        of the active procedure.
+        """
+        order = self.active_system()
+        for alignment in self.alignments.values():
+            for key_set in alignment:
+                for system in key_set:
+                    if system not in order:
+                        order.append(system)
+        return order
+
+    @pyqtSlot(int, int, str)
+    def on_prefetch_progress(self, loaded, total, system):
+        """
+        Slot for the background prefetcher. Shows how many systems are ready.
+        """
+        if loaded < total:
+            txt = 'Loaded {} ({}/{} systems)'.format(system, loaded, total)
+        else:
+            failed = [name for name in self.prefetch_order()
+                      if self.loader[name] is None]
+            if failed:
+                txt = 'Systems loaded, failed to load: {}'.format(
+                                                        ', '.join(failed))
+            else:
+                txt = 'All {} systems loaded'.format(total)
+        self.ui.load_status_label.setText(txt)
+
+    @pyqtSlot(int, int)
+    def on_prefetch_stopped(self, loaded, total):
+        """
+        Slot for the background prefetcher when the system cache is full.
+        """
+        txt = 'Loaded {}/{} systems, the rest load when selected'.format(
+                                                                loaded, total)
+        self.ui.load_status_label.setText(txt)
+
+    def update_imager_combo(self):
+        """
+        Fill the imager combo box with every imager in the loaded systems,
+        keeping the current selection if it is still available.
+        """
+        combo = self.ui.image_title_combo
+        names = [entry['imager'] for entry in
+                 self.loader.system_index.values()]
+        if names == self.all_imager_names:
+            return
+        current = combo.currentText()
+        combo.blockSignals(True)
+        try:
+            combo.clear()
+            self.all_imager_names = names
+            self.imager_index = {}
+            for index, imager_name in enumerate(names):
+                combo.addItem(imager_name)
+                self.imager_index.setdefault(imager_name, index)
+            if current in self.imager_index:
+                combo.setCurrentIndex(self.imager_index[current])
+        finally:
+            combo.blockSignals(False)
+
+    @pyqtSlot()
+    def on_reload_timer(self):
+        """
+        Slot for the configuration poll timer. Reloads the configuration if
+        the files have been edited, but never in the middle of a procedure.
+        """
+        try:
+            if not self.busy and self.RE.state == 'idle':
+                self.loader.reload()
+        except:
+            logger.exception('Error on reloading configuration')
+
+    def on_config_reloaded(self, changes):
+        """
+        Callback for the ConfigReader after the configuration files have been
+        reloaded. Swaps in the recreated devices where they are displayed.
+
+        Parameters
+        ----------
+        changes: ConfigChanges
+            Devices and systems affected by the edit
+        """
+        logger.info('Configuration reloaded. Devices added: %s, removed: %s, '
+                    'changed: %s', changes.added, changes.removed,
+                    changes.changed)
+        combo = self.ui.image_title_combo
+        old_imager = combo.currentText()
+        self.update_imager_combo()
+        affected = set(changes.systems)
+        if affected.intersection(self.active_system()):
+            self.on_procedure_combo_changed(self.procedure)
+        imager = combo.currentText()
+        if (imager != old_imager
+                or affected.intersection(self.loader.get_systems_with(imager))):
+            self.on_image_combo_changed(imager)
+
     @pyqtSlot(str)
     def on_image_combo_changed(self, imager_name):
         """
@@ -364,20 +512,24 @@ class SkywalkerGui(Display):
             # Assume that imagers have exactly one slit and one rotation
             # Therefore, we can pick an arbitrary system entry that includes
             # the imager
+            self.imager_system = systems[0]
+            self.pin_systems()
             objs = self.loader.get_subsystem(systems[0])
             # This may have entries or may be missing entries if there was a
             # problem.
             try:
                 image_obj = objs['imager']
-                rotation = objs.get('rotation', 0)
                 self.image_obj = image_obj
-                self.image_group.change_obj(image_obj, rotation=rotation)
+                self.image_rotation = objs.get('rotation', 0)
+                self.watch_ready(image_obj)
             except KeyError:
                 logger.error('Failed to connect to imager')
             # Slits wasn't a mandatory field.
             slits_obj = objs.get('slits')
             if slits_obj is not None:
                 self.slit_group.change_obj(slits_obj)
+                self.watch_ready(slits_obj)
+            self.update_ready()
         except:
             logger.exception('Error on selecting imager')
 
@@ -397,8 +549,10 @@ class SkywalkerGui(Display):
             logger.info('Selecting procedure %s', procedure_name)
             self.procedure = procedure_name
             if procedure_name == 'None':
+                self.update_ready()
                 return
             else:
+                self.prefetcher.prioritize(self.active_system())
                 self.load_active_system()
             for obj, widgets in zip(self.mirrors_padded(), self.mirror_groups):
                 if obj is None:
@@ -407,6 +561,7 @@ class SkywalkerGui(Display):
                 else:
                     widgets.change_obj(obj)
                     widgets.show()
+                    self.watch_ready(obj)
             for obj, widgets in zip(self.imagers_padded(), self.goals_groups):
                 widgets.save_value()
                 widgets.clear()
@@ -422,9 +577,80 @@ class SkywalkerGui(Display):
                     else:
                         widgets.checkbox.setEnabled(True)
                     widgets.show()
+            for obj in self.imagers() + self.slits():
+                self.watch_ready(obj)
+            self.update_ready()
         except:
             logger.exception('Error on selecting procedure')
 
+    def is_ready(self, obj):
+        """
+        Whether a device has finished connecting.
+        """
+        if obj is None:
+            return False
+        try:
+            future = self.loader.ready(obj.name)
+        except KeyError:
+            return False
+        return future.done() and future.exception() is None
+
+    def watch_ready(self, obj):
+        """
+        Emit device_ready once a device finishes connecting, so that its
+        widgets can be enabled.
+        """
+        if obj is None:
+            return
+        try:
+            future = self.loader.ready(obj.name)
+        except KeyError:
+            return
+        if not future.done():
+            name = obj.name
+            future.add_done_callback(lambda f: self.device_ready.emit(name))
+
+    @pyqtSlot()
+    @pyqtSlot(str)
+    def update_ready(self, name=None):
+        """
+        Slot for device_ready. Greys out the widgets of devices that are still
+        connecting and only enables the start button once every device in the
+        active procedure is ready.
+        """
+        try:
+            for widgets in self.mirror_groups:
+                widgets.set_enabled(self.is_ready(widgets.obj))
+            self.slit_group.set_enabled(self.is_ready(self.slit_group.obj))
+            # Setting up the image widgets reads from the imager, so only swap
+            # it in once it has connected
+            if (self.image_group.obj is not self.image_obj
+                    and self.is_ready(self.image_obj)):
+                self.image_group.change_obj(self.image_obj,
+                                            rotation=self.image_rotation)
+            showing = self.image_group.obj
+            self.image_group.set_enabled(showing is not None
+                                         and showing is self.image_obj)
+            self.ui.start_button.setEnabled(self.procedure_ready())
+        except:
+            logger.exception('Error on updating device readiness')
+
+    def procedure_ready(self):
+        """
+        Whether every system in the active procedure is loaded and all of its
+        devices have connected. Systems without slits only wait on the rest.
+        """
+        for system in self.active_system():
+            if self.loader[system] is None:
+                return False
+            try:
+                future = self.loader.system_ready(system)
+            except KeyError:
+                return False
+            if not future.done() or future.exception() is not None:
+                return False
+        return True
+
     @pyqtSlot()
     def on_goal_changed(self):
         """
@@ -443,6 +669,9 @@ class SkywalkerGui(Display):
         from a paused state.
         """
         try:
+            if self.busy:
+                logger.info("Please wait for the procedure to finish.")
+                return
             if self.RE.state == 'idle':
                 # Check for valid procedure
                 if self.procedure == 'None':
@@ -463,9 +692,8 @@ class SkywalkerGui(Display):
 
                 logger.info("Starting %s procedure with goals %s",
                             self.procedure, raw_goals)
-                self.install_pick_cam()
-                self.auto_switch_cam = True
                 alignment = self.alignments[self.procedure]
+                plans = []
                 for key_set in alignment:
                     yags = [self.loader[key]['imager'] for key in key_set]
                     mots = [self.loader[key]['mirror'] for key in key_set]
@@ -506,25 +734,62 @@ class SkywalkerGui(Display):
                     # Temporary fix: undo skywalker's goal mangling.
                     # TODO remove goal mangling from skywalker.
                     goals = [480 - g for g in goals]
-                    plan = skywalker(yags, mots, det_rbv, mot_rbv, goals,
-                                     first_steps=first_steps,
-                                     tolerances=tolerances,
-                                     averages=average, timeout=timeout,
-                                     sim=self.sim, use_filters=not self.sim,
-                                     tol_scaling=tol_scaling,
-                                     extra_stage=extra_stage)
-                    self.initialize_RE()
-                    self.RE(plan)
+                    plans.append(skywalker(yags, mots, det_rbv, mot_rbv,
+                                           goals, first_steps=first_steps,
+                                           tolerances=tolerances,
+                                           averages=average, timeout=timeout,
+                                           sim=self.sim,
+                                           use_filters=not self.sim,
+                                           tol_scaling=tol_scaling,
+                                           extra_stage=extra_stage))
+                self.initialize_RE()
+                self.start_job(self.run_plans, plans)
             elif self.RE.state == 'paused':
                 logger.info("Resuming procedure.")
-                self.install_pick_cam()
-                self.auto_switch_cam = True
-                self.RE.resume()
+                self.start_job()
         except:
             logger.exception('Error in running procedure')
-        finally:
             self.auto_switch_cam = False
 
+    def run_plans(self, plans):
+        """
+        Run plans one after another. Called in the runner thread.
+        """
+        for plan in plans:
+            self.RE(plan)
+
+    def start_job(self, job=None, *args, callback=None):
+        """
+        Hand a job to the runner, or resume the paused one if no job is
+        given, and follow the cameras while it runs.
+        """
+        self.install_pick_cam()
+        self.auto_switch_cam = True
+        self.busy = True
+        self.latency.start()
+        if job is None:
+            self.runner.resume()
+        else:
+            self.runner.submit(job, *args, callback=callback)
+
+    @pyqtSlot()
+    def on_job_finished(self):
+        """
+        Slot for the runner finishing, pausing or failing a job.
+        """
+        self.auto_switch_cam = False
+        self.busy = False
+        self.latency.stop()
+        logger.debug(self.latency.summary())
+
+    @pyqtSlot(str)
+    def on_state_changed(self, state):
+        """
+        Slot for the RunEngine changing state. Keeps the status string updated.
+        """
+        txt = " Status: " + state.capitalize()
+        self.ui.status_label.setText(txt)
+
     @pyqtSlot()
     def on_pause_button(self):
         """
@@ -535,7 +800,7 @@ class SkywalkerGui(Display):
         if self.RE.state == 'running':
             logger.info("Pausing procedure.")
             try:
-                self.RE.request_pause()
+                self.runner.pause()
             except:
                 logger.exception("Error on pause.")
 
@@ -549,7 +814,7 @@ class SkywalkerGui(Display):
         if self.RE.state != 'idle':
             logger.info("Aborting procedure.")
             try:
-                self.RE.abort()
+                self.runner.abort()
             except:
                 logger.exception("Error on abort.")
 
@@ -559,6 +824,9 @@ class SkywalkerGui(Display):
         Slot for the slits procedure. This checks the slit fiducialization.
         """
         try:
+            if self.busy or self.RE.state != 'idle':
+                logger.info("Please wait for the procedure to finish.")
+                return
             logger.info('Starting slit check process.')
             image_to_check = []
             slits_to_check = []
@@ -576,9 +844,6 @@ class SkywalkerGui(Display):
             logger.info('Checking the following slits: %s',
                         [slit.name for slit in slits_to_check])
 
-            self.install_pick_cam()
-            self.auto_switch_cam = True
-
             slit_width = self.settings_cache['slit_width']
             samples = self.settings_cache['samples']
 
@@ -595,8 +860,8 @@ class SkywalkerGui(Display):
                     output = modifier - output
                 output_obj[img.name] = output
 
-            self.initialize_RE()
             results = {}
+            plans = []
             for img, slit in zip(image_to_check, slits_to_check):
                 systems = self.loader.get_systems_with(img.name)
                 objs = self.loader.get_subsystem(systems[0])
@@ -604,22 +869,33 @@ class SkywalkerGui(Display):
                 this_plan = plan(img, slit, rotation, results)
                 wrapped = run_wrapper(this_plan)
                 wrapped = stage_wrapper(wrapped, [img, slit])
-                self.RE(wrapped)
+                plans.append(wrapped)
 
-            logger.info('Slit scan found the following goals: %s', results)
-            if self.ui.slit_fill_check.isChecked():
-                logger.info('Filling goal fields automatically.')
-                for img, fld in zip(self.imagers_padded(), self.goals_groups):
-                    if img is not None:
-                        try:
-                            fld.value = round(results[img.name], 1)
-                        except KeyError:
-                            pass
+            def job():
+                self.run_plans(plans)
+                return results
+
+            self.initialize_RE()
+            self.start_job(job, callback=self.on_slits_finished)
         except:
             logger.exception('Error on slits button')
-        finally:
             self.auto_switch_cam = False
 
+    def on_slits_finished(self, results):
+        """
+        Callback for the end of the slits procedure. Reports the goals it
+        found, and fills them in if requested.
+        """
+        logger.info('Slit scan found the following goals: %s', results)
+        if self.ui.slit_fill_check.isChecked():
+            logger.info('Filling goal fields automatically.')
+            for img, fld in zip(self.imagers_padded(), self.goals_groups):
+                if img is not None:
+                    try:
+                        fld.value = round(results[img.name], 1)
+                    except KeyError:
+                        pass
+
     @pyqtSlot()
     def on_save_mirrors_button(self):
         try:
@@ -730,7 +1006,7 @@ class SkywalkerGui(Display):
         except AttributeError:
             installed = set()
             self.installed = installed
-        for system in self.loader.cache.values():
+        for system in list(self.loader.cache.values()):
             imager = system['imager']
             if imager not in installed:
                 imager.subscribe(self.pick_cam, event_type=imager.SUB_STATE,
@@ -756,7 +1032,7 @@ class SkywalkerGui(Display):
                     name = chosen_imager.name
                     if name != combo.currentText():
                         logger.info('Automatically switching cam to %s', name)
-                        index = self.all_imager_names.index(name)
+                        index = self.imager_index[name]
                         combo.setCurrentIndex(index)
 
     def read_config(self):
@@ -833,8 +1109,27 @@ class SkywalkerGui(Display):
         return active_system
 
     def load_active_system(self):
-        for system in self.active_system():
-            self.loader.get_subsystem(system)
+        self.pin_systems()
+        self.loader.get_subsystems(self.active_system())
+
+    def pin_systems(self):
+        """
+        Keep the systems on screen loaded while others are evicted.
+        """
+        pinned = self.active_system()
+        imager_system = getattr(self, 'imager_system', None)
+        if imager_system is not None:
+            pinned.append(imager_system)
+        self.loader.pin(pinned)
+
+    def on_system_evicted(self, system, objs):
+        """
+        Callback for the loader when it drops a system. Forget that we
+        subscribed to its imager so we subscribe again if it is reloaded.
+        """
+        logger.debug('Unloaded system %s', system)
+        installed = getattr(self, 'installed', set())
+        installed.discard(objs.get('imager'))
 
     def _objs(self, key):
         objs = []
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+import threading
+
+from pydm.PyQt.QtCore import QThread, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher(QThread):
+    """
+    Thread to load subsystems into a ConfigReader ahead of time so that they
+    are already cached when the user selects them.
+
+    Systems are loaded in the order they are given. The order can be changed
+    while the thread is running with :meth:`.prioritize`. If the loader has a
+    bounded cache, prefetching stops once it is full rather than evicting the
+    systems that were loaded first, and :attr:`.stopped` is emitted instead
+    of a final :attr:`.progress`.
+    """
+    progress = pyqtSignal(int, int, str)
+    stopped = pyqtSignal(int, int)
+
+    def __init__(self, loader, systems):
+        """
+        Parameters
+        ----------
+        loader: ConfigReader
+            Object that loads and caches the subsystems
+
+        systems: list
+            Names of the systems to load, highest priority first
+        """
+        super().__init__()
+        self.loader = loader
+        self.total = 0
+        self.loaded = 0
+        self._lock = threading.Lock()
+        self._queue = []
+        self._done = set()
+        self.prioritize(systems)
+
+    def prioritize(self, systems):
+        """
+        Move systems to the front of the queue, adding them if they were not
+        already scheduled. Systems that were already prefetched are skipped.
+
+        Parameters
+        ----------
+        systems: list
+            Names of the systems to load next
+        """
+        with self._lock:
+            systems = [system for system in systems
+                       if system not in self._done]
+            queued = [system for system in self._queue
+                      if system not in systems]
+            new = [system for system in systems
+                   if system not in self._queue]
+            self.total += len(new)
+            self._queue = systems + queued
+
+    def run(self):
+        while not self.isInterruptionRequested():
+            with self._lock:
+                if not self._queue:
+                    return
+                system = self._queue.pop(0)
+            if getattr(self.loader.cache, 'full', False):
+                logger.debug('System cache is full, stopped prefetching')
+                self.stopped.emit(self.loaded, self.total)
+                return
+            try:
+                logger.debug('Prefetching system %s', system)
+                self.loader.get_subsystem(system)
+            except Exception:
+                logger.exception('Error prefetching system %s', system)
+            with self._lock:
+                self._done.add(system)
+            self.loaded += 1
+            self.progress.emit(self.loaded, self.total, system)
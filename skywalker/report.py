@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of device loading
+
+Every device loaded by a :class:`.ConfigReader` is timed in separate phases so
+that it is possible to see which devices, and which part of creating them,
+dominate the startup of an application.
+"""
+import csv
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+
+import simplejson
+
+logger = logging.getLogger(__name__)
+
+
+class LoadReport:
+    """
+    Timing and outcome of every device load
+
+    Each device has a record with the time spent in each of the
+    :attr:`.phases`, the total of these, the number of signals on the device,
+    how many of them were created and connected, and the reason it failed if
+    it did. A device that is loaded more than once only keeps the latest
+    attempt
+    """
+    phases = ('lookup', 'resolve', 'construct', 'connect')
+    fields = (('name', 'device_class') + phases
+              + ('total', 'signals', 'created', 'connected', 'error'))
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.records = OrderedDict()
+
+    def start(self, name, device_class=None):
+        """
+        Begin a new record for a device, discarding any previous one
+        """
+        with self._lock:
+            self.records.pop(name, None)
+            record = dict.fromkeys(self.fields)
+            record['name'] = name
+            record['device_class'] = device_class
+            self.records[name] = record
+
+    def update(self, name, **info):
+        """
+        Add information to the record of a device
+        """
+        with self._lock:
+            record = self.records.get(name)
+            if record is None:
+                self.start(name)
+                record = self.records[name]
+            record.update(info)
+            record['total'] = sum(record[phase] or 0.
+                                  for phase in self.phases)
+
+    @contextmanager
+    def phase(self, name, phase):
+        """
+        Time a phase of loading a device
+
+        Parameters
+        ----------
+        name : str
+            Name of the device
+
+        phase : str
+            One of :attr:`.phases`
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.update(name, **{phase: time.perf_counter() - start})
+
+    def as_dict(self):
+        """
+        Copy of every record, keyed by device name
+        """
+        with self._lock:
+            return OrderedDict((name, dict(record))
+                               for name, record in self.records.items())
+
+    def slowest(self, count=10, phase='total'):
+        """
+        Records of the devices that took longest in a phase
+
+        Parameters
+        ----------
+        count : int, optional
+            Maximum number of records to return
+
+        phase : str, optional
+            Phase to sort by, or 'total'
+        """
+        records = self.as_dict().values()
+        return sorted(records, key=lambda record: record[phase] or 0.,
+                      reverse=True)[:count]
+
+    def failures(self):
+        """
+        Reasons for failure keyed by device name
+        """
+        return dict((name, record['error'])
+                    for name, record in self.as_dict().items()
+                    if record['error'])
+
+    def signal_counts(self):
+        """
+        Number of signals over every device
+
+        Returns
+        -------
+        counts : dict
+            Total number of `signals` the devices define, how many were
+            `created` and `connected`, and how many were `avoided` by leaving
+            them lazy
+        """
+        counts = dict.fromkeys(('signals', 'created', 'connected'), 0)
+        for record in self.as_dict().values():
+            for key in counts:
+                counts[key] += record[key] or 0
+        counts['avoided'] = counts['signals'] - counts['created']
+        return counts
+
+    def dump(self, path):
+        """
+        Write every record to a file
+
+        Parameters
+        ----------
+        path : str
+            Destination. Files ending with `.csv` are written as a table,
+            anything else as JSON
+        """
+        records = list(self.as_dict().values())
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=self.fields)
+                writer.writeheader()
+                writer.writerows(records)
+        else:
+            with open(path, 'w') as f:
+                simplejson.dump(records, f, indent=2)
+
+    def summary(self, count=10):
+        """
+        Human readable summary of the slowest and failed devices
+        """
+        records = self.as_dict()
+        total = sum(record['total'] or 0. for record in records.values())
+        lines = ['Loaded {} devices in {:.2f}s of device time'
+                 ''.format(len(records), total)]
+        for phase in self.phases:
+            spent = sum(record[phase] or 0. for record in records.values())
+            lines.append('  {:<10} {:8.3f}s'.format(phase, spent))
+        counts = self.signal_counts()
+        if counts['signals']:
+            lines.append('Created {created} of {signals} signals, {connected} '
+                         'connected, {avoided} left unconnected'
+                         ''.format(**counts))
+        lines.append('Slowest devices:')
+        for record in self.slowest(count=count):
+            lines.append('  {:<30} {:8.3f}s ({} signals)'
+                         ''.format(record['name'], record['total'] or 0.,
+                                   record['signals']))
+        failures = self.failures()
+        if failures:
+            lines.append('Failed devices:')
+            for name, error in sorted(failures.items()):
+                lines.append('  {:<30} {}'.format(name, error))
+        return '\n'.join(lines)
+
+    def log_summary(self, count=10, level=logging.INFO):
+        """
+        Write :meth:`.summary` to the log
+        """
+        logger.log(level, self.summary(count=count))
+
+    def clear(self):
+        """
+        Forget every record
+        """
+        with self._lock:
+            self.records.clear()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Execution of bluesky plans away from the Qt event loop
+
+A :class:`.PlanRunner` owns the RunEngine and runs every plan in its own
+thread, so the image and centroid displays keep updating while an alignment
+is in progress. Results and state changes are handed back to the GUI through
+Qt signals, which are delivered in the thread of the receiving widget. Log
+messages already reach the GUI through :class:`.GuiHandler`, which emits a
+signal of its own.
+
+Older versions of bluesky always install a SIGINT handler when a plan runs,
+which Python only allows on the main thread. With these the runner falls back
+to running plans on the Qt thread, kept alive by ``install_qt_kicker``.
+"""
+import time
+import queue
+import asyncio
+import logging
+
+from bluesky import RunEngine
+from bluesky.utils import install_qt_kicker, RunEngineInterrupted
+
+from pydm.PyQt.QtCore import QObject, QThread, QTimer, pyqtSignal, pyqtSlot
+
+logger = logging.getLogger(__name__)
+
+
+class PlanRunner(QThread):
+    """
+    Thread that runs jobs against its RunEngine one at a time.
+
+    A job is any function that calls the RunEngine, possibly more than once.
+    Queue jobs with :meth:`.submit`, and control the running plan with
+    :meth:`.pause`, :meth:`.resume` and :meth:`.abort`, which are safe to call
+    from the Qt thread at any time.
+
+    Parameters
+    ----------
+    threaded: bool, optional
+        Run jobs in this thread. If False, or if the installed bluesky can
+        not run plans off the main thread, jobs run immediately in the thread
+        that submits them.
+    """
+    state_changed = pyqtSignal(str)
+    job_finished = pyqtSignal()
+    _job_done = pyqtSignal(object, object)
+
+    def __init__(self, threaded=True):
+        super().__init__()
+        self.threaded = threaded
+        self.RE = None
+        if threaded:
+            loop = asyncio.new_event_loop()
+            try:
+                # Skip the SIGINT handler, which only works on the main thread
+                self.RE = RunEngine({}, loop=loop, context_managers=[])
+            except TypeError:
+                logger.warning('This version of bluesky can not run plans in '
+                               'a background thread, running them on the GUI '
+                               'thread instead')
+                loop.close()
+                self.threaded = False
+        if self.RE is None:
+            self.RE = RunEngine({})
+            install_qt_kicker()
+        self._queue = queue.Queue()
+        self._job_done.connect(self._deliver)
+        self.RE.state_hook = self._on_state
+
+    def _on_state(self, state, old_state):
+        self.state_changed.emit(state)
+
+    def submit(self, job, *args, callback=None):
+        """
+        Run a job after any that are already queued.
+
+        Parameters
+        ----------
+        job: callable
+            Function that runs plans on :attr:`.RE`
+
+        args:
+            Passed to job
+
+        callback: callable, optional
+            Called in the Qt thread with the return value of the job, unless
+            the job raised or was paused
+        """
+        if self.threaded:
+            self._queue.put((job, args, callback))
+        else:
+            self._run_job(job, args, callback)
+
+    def run(self):
+        while self.threaded:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._run_job(*item)
+
+    def _run_job(self, job, args, callback):
+        result = None
+        completed = False
+        try:
+            result = job(*args)
+            completed = True
+        except RunEngineInterrupted:
+            logger.info('Procedure interrupted.')
+        except Exception:
+            logger.exception('Error in running procedure')
+        if self.threaded:
+            self._job_done.emit(callback if completed else None, result)
+        else:
+            self._deliver(callback if completed else None, result)
+
+    @pyqtSlot(object, object)
+    def _deliver(self, callback, result):
+        try:
+            if callback is not None:
+                callback(result)
+        except Exception:
+            logger.exception('Error handling procedure result')
+        finally:
+            self.job_finished.emit()
+
+    def pause(self):
+        """
+        Ask the running plan to pause.
+        """
+        if self.RE.state != 'running':
+            return
+        if self.threaded:
+            self.RE.loop.call_soon_threadsafe(self.RE.request_pause)
+        else:
+            self.RE.request_pause()
+
+    def resume(self):
+        """
+        Continue a paused plan.
+        """
+        self.submit(self.RE.resume)
+
+    def abort(self):
+        """
+        Stop a running or paused plan.
+        """
+        if self.RE.state == 'idle':
+            return
+        if self.threaded and self.RE.state != 'paused':
+            # Cancel the plan from inside the loop that is running it
+            self.RE.loop.call_soon_threadsafe(self.RE.abort)
+        else:
+            # Cleaning up a paused plan runs the loop again
+            self.submit(self.RE.abort)
+
+    def stop(self):
+        """
+        Abort any plan and wait for the thread to finish.
+        """
+        try:
+            self.abort()
+        except Exception:
+            logger.exception('Error on abort')
+        if self.threaded and self.isRunning():
+            self._queue.put(None)
+            self.wait()
+
+
+class LatencyMonitor(QObject):
+    """
+    Measure how responsive the Qt event loop is.
+
+    A timer is scheduled every `interval` milliseconds and the time by which
+    each tick arrives late is recorded. Long plans running on the Qt thread
+    show up as large delays.
+
+    Parameters
+    ----------
+    interval: int, optional
+        Milliseconds between ticks
+    """
+    def __init__(self, interval=50, parent=None):
+        super().__init__(parent=parent)
+        self.interval = interval
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.on_tick)
+        self.delays = []
+        self._last = None
+
+    def start(self):
+        """
+        Forget previous measurements and begin measuring.
+        """
+        self.delays = []
+        self._last = time.perf_counter()
+        self.timer.start()
+
+    def stop(self):
+        """
+        Stop measuring.
+        """
+        self.timer.stop()
+
+    @pyqtSlot()
+    def on_tick(self):
+        now = time.perf_counter()
+        elapsed = (now - self._last) * 1000.
+        self.delays.append(max(elapsed - self.interval, 0.))
+        self._last = now
+
+    def stats(self):
+        """
+        Delays in milliseconds.
+
+        Returns
+        -------
+        stats: dict
+            Number of `ticks` along with the `mean`, 95th percentile `p95`
+            and `max` delay, or None if nothing was measured
+        """
+        if not self.delays:
+            return None
+        delays = sorted(self.delays)
+        return dict(ticks=len(delays),
+                    mean=sum(delays) / len(delays),
+                    p95=delays[min(int(len(delays) * 0.95), len(delays) - 1)],
+                    max=delays[-1])
+
+    def summary(self):
+        """
+        Human readable description of :meth:`.stats`.
+        """
+        stats = self.stats()
+        if stats is None:
+            return 'No event loop latency measured'
+        return ('Event loop latency over {ticks} ticks: mean {mean:.1f} ms, '
+                '95% {p95:.1f} ms, max {max:.1f} ms'.format(**stats))
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local service sharing the parsed configuration between processes
+
+Every console runs its own copies of Skywalker and Lightpath, each of which
+would otherwise parse and index the same configuration files. A single
+:class:`.ConfigService` keeps the parsed configuration in memory and hands it
+to any :class:`.ConfigReader` on the same machine over a Unix socket. Readers
+fall back to the files whenever the service is not running or is serving a
+different configuration.
+
+Requests and responses are single lines of JSON. The only request understood
+is ``{"method": "metadata"}``, answered with the paths of the source files and
+the parsed information, or ``{"error": ...}`` if it can not be provided.
+"""
+import os
+import os.path
+import socket
+import logging
+import threading
+import socketserver
+
+import simplejson
+
+from skywalker.compiler import parse_metadata
+from skywalker.diskcache import DEFAULT_CACHE_DIR, fingerprint
+
+logger = logging.getLogger(__name__)
+
+#Clients ignore a service that answers with a different version
+PROTOCOL_VERSION = 1
+
+DEFAULT_SOCKET = os.path.join(DEFAULT_CACHE_DIR, 'config.sock')
+
+
+class ConfigRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Answer a single request from a client
+    """
+    def handle(self):
+        line = self.rfile.readline()
+        #Connections that only check the service is alive
+        if not line:
+            return
+        try:
+            request = simplejson.loads(line.decode())
+            method = request.get('method')
+            if method == 'metadata':
+                response = self.server.metadata()
+            else:
+                response = self.server.encode({'error': 'Unknown method {}'
+                                                        ''.format(method)})
+        except Exception as exc:
+            logger.exception("Error handling request")
+            response = self.server.encode({'error': str(exc)})
+        self.wfile.write(response)
+
+
+class ConfigService(socketserver.ThreadingMixIn,
+                    socketserver.UnixStreamServer):
+    """
+    Serve the parsed configuration to local clients
+
+    The configuration files are parsed on the first request and again only
+    when their modification time or size changes. The encoded response is
+    kept so that repeated requests cost nothing but the transfer
+
+    Parameters
+    ----------
+    happi_json : str
+        Path to JSON file that contains happi information
+
+    system_json : str
+        Path to JSON file that holds device names to load from happi
+
+    path : str, optional
+        Location of the Unix socket
+
+    Raises
+    ------
+    OSError:
+        If another service is already listening on `path`
+    """
+    daemon_threads = True
+
+    def __init__(self, happi_json, system_json, path=DEFAULT_SOCKET):
+        self.sources = {'happi': os.path.abspath(happi_json),
+                        'system': os.path.abspath(system_json)}
+        self.path = path
+        self.served = 0
+        self._lock = threading.Lock()
+        self._stats = None
+        self._response = None
+        if os.path.exists(path):
+            if ping(path):
+                raise OSError("A configuration service is already running on "
+                              "{}".format(path))
+            #Left behind by a service that did not shut down cleanly
+            os.remove(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        super().__init__(path, ConfigRequestHandler)
+        #Only serve the user that started the service
+        os.chmod(path, 0o600)
+
+    @staticmethod
+    def encode(response):
+        return (simplejson.dumps(response, separators=(',', ':'))
+                + '\n').encode()
+
+    def metadata(self):
+        """
+        Encoded configuration, parsing the files again if they have changed
+        """
+        with self._lock:
+            stats = [fingerprint(source, digest=False)
+                     for source in (self.sources['happi'],
+                                    self.sources['system'])]
+            if stats != self._stats:
+                logger.info("Parsing configuration files")
+                data = parse_metadata(self.sources['happi'],
+                                      self.sources['system'])
+                self._response = self.encode({'version': PROTOCOL_VERSION,
+                                              'sources': self.sources,
+                                              'data': data})
+                self._stats = stats
+            self.served += 1
+            return self._response
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def request(path, method, timeout=2.0):
+    """
+    Send a request to a running :class:`.ConfigService`
+
+    Parameters
+    ----------
+    path : str
+        Location of the Unix socket
+
+    method : str
+        Name of the request
+
+    timeout : float, optional
+        Time to wait for the service
+
+    Returns
+    -------
+    response : dict
+
+    Raises
+    ------
+    OSError:
+        If the service can not be reached
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(ConfigService.encode({'method': method}))
+        chunks = list()
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return simplejson.loads(b''.join(chunks).decode())
+
+
+def ping(path, timeout=0.5):
+    """
+    Whether a service is listening on `path`
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+    except OSError:
+        return False
+    return True
+
+
+def fetch_metadata(path, happi_json, system_json, timeout=2.0):
+    """
+    Get the parsed configuration from a running :class:`.ConfigService`
+
+    Parameters
+    ----------
+    path : str
+        Location of the Unix socket
+
+    happi_json : str
+        Path to JSON file that contains happi information
+
+    system_json : str
+        Path to JSON file that holds device names to load from happi
+
+    timeout : float, optional
+        Time to wait for the service
+
+    Returns
+    -------
+    data : dict or None
+        Parsed information in the same form as
+        :func:`skywalker.compiler.parse_metadata`, or `None` if the service is
+        not running or is serving different files
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        response = request(path, 'metadata', timeout=timeout)
+    except Exception:
+        logger.warning("Unable to reach configuration service at %s", path,
+                       exc_info=True)
+        return None
+    if 'error' in response:
+        logger.warning("Configuration service failed: %s", response['error'])
+        return None
+    if response.get('version') != PROTOCOL_VERSION:
+        logger.warning("Configuration service uses a different protocol")
+        return None
+    expected = {'happi': os.path.abspath(happi_json),
+                'system': os.path.abspath(system_json)}
+    if response['sources'] != expected:
+        logger.debug("Configuration service is serving other files")
+        return None
+    logger.debug("Using configuration from service at %s", path)
+    return response['data']
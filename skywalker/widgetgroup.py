@@ -52,6 +52,15 @@ class BaseWidgetGroup:
         if self.label is not None:
             self.label.show()
 
+    def set_enabled(self, enabled):
+        """
+        Enable or grey out all widgets in group.
+        """
+        for widget in self.widgets:
+            widget.setEnabled(enabled)
+        if self.label is not None:
+            self.label.setEnabled(enabled)
+
     def text(self):
         if self.label is None:
             return None
@@ -2,6 +2,7 @@
 # Standard #
 ############
 import os
+import shutil
 import logging
 
 ###############
@@ -10,12 +11,54 @@ import logging
 import pytest
 
 
+def make_test_path(path):
+    """
+    Make a file in the test directory absolute
+    """
+    return os.path.join(os.path.dirname(__file__), path)
+
+
 #Enable the logging level to be set from the command line
 def pytest_addoption(parser):
     parser.addoption("--log", action="store", default="DEBUG",
                      help="Set the level of the log")
     parser.addoption("--logfile", action="store", default=None,
                      help="Write the log output to specified file path")
+    parser.addoption("--benchmark", action="store_true", default=False,
+                     help="Run the benchmarks and compare against baselines")
+    parser.addoption("--update-baselines", action="store_true",
+                     default=False,
+                     help="Store the benchmark results as the new baselines")
+    parser.addoption("--baselines", action="store",
+                     default=os.path.join(os.path.dirname(__file__),
+                                          'benchmarks.json'),
+                     help="File to read and store benchmark baselines")
+    parser.addoption("--tolerance", action="store", default=1.5, type=float,
+                     help="Allowed ratio of a benchmark result to baseline")
+
+def pytest_configure(config):
+    config.addinivalue_line("markers",
+                            "benchmark: compare performance to baselines")
+
+#Benchmarks are slow, so only run them when asked
+def pytest_collection_modifyitems(config, items):
+    if (config.getoption('--benchmark')
+            or config.getoption('--update-baselines')):
+        return
+    skip = pytest.mark.skip(reason="Use --benchmark to run benchmarks")
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+#Copy the test configuration so that it can be modified
+@pytest.fixture(scope='function')
+def config_files(tmpdir):
+    paths = list()
+    for name in ('happi.json', 'system.json'):
+        path = str(tmpdir.join(name))
+        shutil.copy(make_test_path(name), path)
+        paths.append(path)
+    return paths
 
 #Create a fixture to automatically instantiate logging setup
 @pytest.fixture(scope='session', autouse=True)
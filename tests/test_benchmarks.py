@@ -0,0 +1,118 @@
+"""
+Benchmarks of ConfigReader against large generated databases
+
+Run with ``--benchmark`` to compare against the stored baselines, or with
+``--update-baselines`` to record the results on this machine as the new
+baselines. Every timing must be within ``--tolerance`` times its baseline
+"""
+############
+# Standard #
+############
+import time
+import tracemalloc
+
+###############
+# Third Party #
+###############
+import pytest
+import simplejson
+
+##########
+# Module #
+##########
+from skywalker.config import ConfigReader
+from pcdsdevices.sim.pv import using_fake_epics_pv
+from conftest import make_test_path
+
+#Timings below this are dominated by noise
+MIN_SECONDS = 0.05
+
+
+def make_database(tmpdir, size):
+    """
+    Write a happi database of `size` devices and a system file grouping them
+    into systems of one mirror, imager and slits
+    """
+    template = simplejson.load(open(make_test_path('happi.json')))
+    template = [template[key] for key in ('MIRR:FEE1:M1H', 'HX2:SB1:PIM',
+                                          'HX2:SB1:JAWS')]
+    db = dict()
+    systems = dict()
+    for i in range(size):
+        info = dict(template[i % 3])
+        prefix = '{}:{:05}'.format(info['prefix'], i)
+        info.update({'_id': prefix, 'prefix': prefix,
+                     'name': '{} {:05}'.format(info['name'], i),
+                     'z': info['z'] + i})
+        db[prefix] = info
+        system = systems.setdefault('sys_{:05}'.format(i // 3),
+                                    {'rotation': 90})
+        system[('mirror', 'imager', 'slits')[i % 3]] = info['name']
+    #Drop an incomplete final system
+    systems = dict((name, system) for name, system in systems.items()
+                   if len(system) == 4)
+    happi_json = str(tmpdir.join('happi.json'))
+    system_json = str(tmpdir.join('system.json'))
+    simplejson.dump(db, open(happi_json, 'w'))
+    simplejson.dump(systems, open(system_json, 'w'))
+    return happi_json, system_json
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+@pytest.fixture(scope='module')
+def baselines(pytestconfig):
+    path = pytestconfig.getoption('--baselines')
+    try:
+        stored = simplejson.load(open(path))
+    except FileNotFoundError:
+        stored = dict()
+    results = dict()
+    yield stored, results
+    if pytestconfig.getoption('--update-baselines'):
+        stored.update(results)
+        with open(path, 'w') as f:
+            simplejson.dump(stored, f, indent=2, sort_keys=True)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize('size', [100, 1000, 10000])
+@using_fake_epics_pv
+def test_config_reader_benchmark(tmpdir, baselines, pytestconfig, size):
+    happi_json, system_json = make_database(tmpdir, size)
+    tracemalloc.start()
+    try:
+        result = dict()
+        start = time.perf_counter()
+        cfg = ConfigReader(happi_json, system_json)
+        result['init'] = time.perf_counter() - start
+        names = list(cfg.resolved)[::max(1, size // 100)]
+        result['get_systems_with'] = timed(lambda: [cfg.get_systems_with(name)
+                                                    for name in names])
+        result['get_subsystem'] = timed(cfg.get_subsystem, 'sys_00000',
+                                        timeout=60)
+        result['load_device'] = timed(cfg.load_device, names[-1], timeout=60)
+        result['load_configuration'] = timed(cfg.load_configuration,
+                                             deadline=600)
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    stored, results = baselines
+    results[str(size)] = result
+    baseline = stored.get(str(size))
+    if baseline is None or pytestconfig.getoption('--update-baselines'):
+        return
+    tolerance = pytestconfig.getoption('--tolerance')
+    regressions = list()
+    for key, value in result.items():
+        allowed = baseline[key] * tolerance
+        if key != 'peak_memory':
+            allowed = max(allowed, MIN_SECONDS)
+        if value > allowed:
+            regressions.append('{} took {:.4g}, baseline {:.4g}'
+                               ''.format(key, value, baseline[key]))
+    assert not regressions, '; '.join(regressions)
@@ -0,0 +1,77 @@
+###############
+# Third Party #
+###############
+import pytest
+import simplejson
+
+##########
+# Module #
+##########
+from skywalker.config import ConfigReader
+from skywalker.compiler import (compile_config, write_artifact, load_artifact,
+                                validate)
+from pcdsdevices.sim.pv import using_fake_epics_pv
+
+
+def test_validate():
+    documents = {'FEE M1H': {'active': True, 'device_class': 'OffsetMirror'},
+                 'HX2 PIM': {'active': False, 'device_class': 'PIM'},
+                 'HX2 Slits': {'active': True, 'device_class': 'NotAClass'}}
+    systems = {'m1h': {'mirror': 'FEE M1H', 'imager': 'HX2 PIM',
+                       'slits': 'HX2 Slits', 'rotation': 90},
+               'm2h': {'mirror': 'FEE M2H', 'imager': 'HX2 PIM'}}
+    problems = validate(documents, systems, {'HOMS': [['m1h', 'm3h']]})
+    assert len(problems) == 7
+    assert any('m3h' in problem for problem in problems)
+    assert any('not active' in problem for problem in problems)
+    assert any('NotAClass' in problem for problem in problems)
+    assert validate(documents, {}) == []
+
+
+@using_fake_epics_pv
+def test_compiled_config(config_files, tmpdir):
+    happi_json, system_json = config_files
+    artifact, problems = compile_config(happi_json, system_json)
+    #The devices of m2h are not in the test database
+    assert problems and all('m2h' in problem for problem in problems)
+    path = str(tmpdir.join('compiled.json'))
+    write_artifact(artifact, path)
+    assert load_artifact(path)['systems'] == artifact['systems']
+    #Load without reading the original files
+    cfg = ConfigReader.from_artifact(path)
+    assert cfg.happi_json == happi_json
+    assert cfg.get_systems_with('FEE M1H') == ['m1h']
+    assert cfg.get_subsystem('m1h')['mirror'].name == 'FEE M1H'
+
+
+def test_outdated_artifact(config_files, tmpdir):
+    happi_json, system_json = config_files
+    artifact, problems = compile_config(happi_json, system_json)
+    path = str(tmpdir.join('compiled.json'))
+    write_artifact(artifact, path)
+    #Edit the system file after compiling
+    systems = simplejson.load(open(system_json))
+    systems['m3h'] = systems['m1h']
+    simplejson.dump(systems, open(system_json, 'w'))
+    cfg = ConfigReader(happi_json, system_json, artifact=path)
+    assert 'm3h' in cfg.available_systems
+    #Artifacts from other versions are refused
+    artifact['version'] = -1
+    write_artifact(artifact, path)
+    with pytest.raises(ValueError):
+        load_artifact(path)
+
+
+def test_artifact_from_other_files(config_files, tmpdir):
+    happi_json, system_json = config_files
+    artifact, problems = compile_config(happi_json, system_json)
+    path = str(tmpdir.join('compiled.json'))
+    write_artifact(artifact, path)
+    #Point the reader at a different system file
+    systems = simplejson.load(open(system_json))
+    systems['m3h'] = systems['m1h']
+    other_json = str(tmpdir.join('other.json'))
+    simplejson.dump(systems, open(other_json, 'w'))
+    cfg = ConfigReader(happi_json, other_json, artifact=path)
+    assert cfg.system_json == other_json
+    assert 'm3h' in cfg.available_systems
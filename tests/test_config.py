@@ -2,11 +2,18 @@
 # Standard #
 ############
 import os.path
+import sys
+import time
+import threading
+import subprocess
+from collections import Counter
+import asyncio
 
 ###############
 # Third Party #
 ###############
 import pytest
+import simplejson
 
 
 ##########
@@ -14,18 +21,15 @@ import pytest
 ##########
 import pcdsdevices
 from pcdsdevices.sim.pim import PIM
-from skywalker.config import ConfigReader, sim_config
+import skywalker.config
+from skywalker.config import (ConfigReader, SimConfigReader, LazyDevice,
+                              SubsystemCache, DeviceLoadError)
 from pcdsdevices.sim.pv import using_fake_epics_pv
+from conftest import make_test_path
 
 #Hack to use simulated PIM
 pcdsdevices.PIM = PIM
 
-def make_test_path(path):
-    """
-    Make a file in the test directory absolute
-    """
-    return os.path.join(os.path.dirname(__file__), path)
-
 @using_fake_epics_pv
 def test_system_loading():
     #Load configuration
@@ -46,3 +50,524 @@ def test_lightpath_loading():
     devs, containers = cfg.load_configuration()
     assert len(devs) == 3
     assert len(containers) == 0
+
+@using_fake_epics_pv
+def test_concurrent_lightpath_loading():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    #Load devices from a pool of threads
+    devs, containers = cfg.load_configuration(max_workers=4, deadline=30)
+    assert len(devs) == 3
+    assert len(containers) == 0
+
+@using_fake_epics_pv
+def test_async_loading():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    loop = asyncio.new_event_loop()
+    try:
+        #Load a subsystem
+        system = loop.run_until_complete(cfg.async_get_subsystem('m1h'))
+        assert all([system[_type] for _type in cfg.device_types])
+        assert cfg['m1h'] is system
+        #Load devices
+        devs, containers = loop.run_until_complete(
+                                cfg.async_load_configuration(deadline=30))
+        assert len(devs) == 3
+        assert len(containers) == 0
+    finally:
+        loop.close()
+
+@using_fake_epics_pv
+def test_lazy_loading():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'),
+                       lazy=True)
+    devs, containers = cfg.load_configuration()
+    assert len(devs) == 3
+    assert len(containers) == 0
+    #Metadata is available without creating the device
+    dev = devs[0]
+    assert isinstance(dev, LazyDevice)
+    assert dev.name
+    assert not dev.loaded
+    #First real use creates the device
+    assert dev.component_names is not None
+    assert dev.loaded
+    #Proxies that fail to load look like they are missing the attribute
+    broken = LazyDevice(cfg.find_container('FEE M1H'), lambda: None)
+    assert not hasattr(broken, 'component_names')
+    assert getattr(broken, 'component_names', None) is None
+    with pytest.raises(DeviceLoadError):
+        broken.load()
+
+@using_fake_epics_pv
+def test_shared_device_cache():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    #Devices loaded for a system are reused by later requests
+    m1h = cfg.get_subsystem('m1h')
+    assert cfg.cache_info().misses == 3
+    assert cfg.load_device('HX2 Slits') is m1h['slits']
+    assert cfg.cache_info().hits == 1
+    #Loading the whole configuration reuses the devices
+    devs, containers = cfg.load_configuration()
+    assert m1h['mirror'] in devs
+    assert cfg.cache_info().currsize == 3
+
+def test_indexes():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    assert cfg.get_systems_with('FEE M1H') == ['m1h']
+    assert cfg.get_systems_with('Not a device') == []
+    info = cfg.get_system_info('m2h')
+    assert info['imager'] == 'HFX DG3 PIM'
+    assert info['rotation'] == 90
+    assert cfg.get_devices_with(device_class='OffsetMirror') == ['FEE M1H']
+    assert set(cfg.get_devices_with(beamline='HXD')) == set(cfg.documents)
+    assert cfg.get_devices_with(device_class='PIM', beamline='MFX') == []
+
+def test_name_index(tmpdir):
+    #Create a large database
+    db = dict()
+    for i in range(10000):
+        prefix = 'TST:DEV:{:05}'.format(i)
+        db[prefix] = {'_id': prefix, 'prefix': prefix, 'active': True,
+                      'name': 'Device {}'.format(i), 'type': 'Device',
+                      'device_class': 'PIM', 'args': [], 'kwargs': {},
+                      'beamline': 'TST', 'z': float(i)}
+    happi_json = str(tmpdir.join('happi.json'))
+    system_json = str(tmpdir.join('system.json'))
+    simplejson.dump(db, open(happi_json, 'w'))
+    simplejson.dump({}, open(system_json, 'w'))
+    cfg = ConfigReader(happi_json, system_json)
+    names = ['Device {}'.format(i) for i in range(0, 10000, 1000)]
+    #Lookups by name and prefix agree
+    for name in names:
+        container = cfg.find_container(name)
+        assert container.name == name
+        assert cfg.find_container(prefix=container.prefix) is container
+    #Index lookups are faster than searching the database
+    cfg.container_index.clear()
+    start = time.time()
+    for name in names:
+        cfg.find_container(name)
+    indexed = time.time() - start
+    start = time.time()
+    for name in names:
+        cfg.client.load_device(name=name)
+    searched = time.time() - start
+    assert indexed < searched
+
+@using_fake_epics_pv
+def test_reload(config_files):
+    happi_json, system_json = config_files
+    db = simplejson.load(open(happi_json))
+    cfg = ConfigReader(happi_json, system_json)
+    notifications = list()
+    cfg.add_reload_callback(notifications.append)
+    system = cfg.get_subsystem('m1h')
+    #Nothing to do if the files are untouched
+    assert cfg.reload() is None
+    #Edit the mirror
+    db['MIRR:FEE1:M1H']['last_edit'] = 'Now'
+    simplejson.dump(db, open(happi_json, 'w'))
+    changes = cfg.reload(force=True)
+    assert changes.changed == ['FEE M1H']
+    assert changes.systems == ['m1h']
+    assert notifications == [changes]
+    #Only the mirror was recreated
+    assert cfg['m1h']['mirror'] is not system['mirror']
+    assert cfg['m1h']['slits'] is system['slits']
+
+@using_fake_epics_pv
+def test_bulk_loading():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    names = ['FEE M1H', 'HX2 PIM', 'Not a device']
+    devices, failures = cfg.load_devices(names, timeout=5)
+    assert [dev.name for dev in devices[:2]] == names[:2]
+    assert devices[2] is None
+    assert failures == {}
+    #Connected devices are cached
+    assert cfg.load_device('FEE M1H') is devices[0]
+
+@using_fake_epics_pv
+def test_bulk_loading_teardown(monkeypatch):
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    torn_down = list()
+    monkeypatch.setattr(skywalker.config, 'teardown_device',
+                        torn_down.append)
+    manifest_signals = cfg._manifest_signals
+
+    class NeverConnected:
+        connected = False
+
+    def unconnected(name, dev):
+        if name == 'HX2 PIM':
+            return [('state', NeverConnected())]
+        return manifest_signals(name, dev)
+
+    cfg._manifest_signals = unconnected
+    devices, failures = cfg.load_devices(['FEE M1H', 'HX2 PIM'],
+                                         timeout=0.2)
+    assert devices[1] is None
+    assert list(failures) == ['HX2 PIM']
+    #The channels of the failed device are closed
+    assert [dev.name for dev in torn_down] == ['HX2 PIM']
+
+@using_fake_epics_pv
+def test_multiple_system_loading():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    systems = cfg.get_subsystems(['m1h', 'm2h'])
+    assert all([systems['m1h'][_type] for _type in cfg.device_types])
+    #The devices of m2h are not in the database
+    assert systems['m2h']['imager'] is None
+    assert cfg['m1h'] is systems['m1h']
+    assert cfg['m2h'] is None
+
+def test_failure_backoff():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    assert cfg.load_device('Not a device') is None
+    assert cfg.failures['Not a device'][0] == 1
+    #Known failures are not attempted again
+    assert cfg.load_device('Not a device') is None
+    assert cfg.failures['Not a device'][0] == 1
+    #Unless explicitly requested
+    assert cfg.load_device('Not a device', use_cache=False) is None
+    assert cfg.failures['Not a device'][0] == 2
+    cfg.retry('Not a device')
+    assert 'Not a device' not in cfg.failures
+
+def test_scoped_selection(config_files):
+    happi_json, system_json = config_files
+    db = simplejson.load(open(happi_json))
+    #Move the imager to another hutch
+    db['HX2:SB1:PIM']['beamline'] = 'MFX'
+    simplejson.dump(db, open(happi_json, 'w'))
+    cfg = ConfigReader(happi_json, system_json)
+    assert cfg.select_devices(beamline='MFX') == ['HX2 PIM']
+    assert set(cfg.select_devices(z_range=(773.7, None))) == {'HX2 PIM'}
+    #Upstream devices on the main line are included
+    upstream = cfg.select_devices(upstream_of='MFX')
+    assert set(upstream) == {'HX2 PIM', 'HX2 Slits', 'FEE M1H'}
+    upstream = cfg.select_devices(upstream_of='MFX', z_range=(750, None))
+    assert set(upstream) == {'HX2 PIM', 'HX2 Slits'}
+    assert set(cfg.select_devices(upstream_of='XPP')) == set()
+
+@using_fake_epics_pv
+def test_streaming_configuration():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    results = list(cfg.iter_configuration(max_workers=4, deadline=30))
+    assert len(results) == 3
+    for container, dev in results:
+        assert dev.name == container.name
+
+def test_subsystem_cache():
+    evicted = list()
+    cache = SubsystemCache(maxsize=2,
+                           on_evict=lambda system, _: evicted.append(system))
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache.full
+    #Accessing a system makes it the most recently used
+    assert cache['a'] == 1
+    cache['c'] = 3
+    assert evicted == ['b']
+    assert set(cache) == {'a', 'c'}
+    #Pinned systems are kept even if they are the oldest
+    cache.pin(['a'])
+    cache['d'] = 4
+    assert evicted == ['b', 'c']
+    assert set(cache) == {'a', 'd'}
+    #Deleting an entry is not an eviction
+    del cache['d']
+    assert evicted == ['b', 'c']
+
+@using_fake_epics_pv
+def test_cache_eviction(config_files):
+    happi_json, system_json = config_files
+    db = simplejson.load(open(happi_json))
+    #Second mirror sharing the imager and slits of the first system
+    m2h = dict(db['MIRR:FEE1:M1H'])
+    m2h.update({'_id': 'MIRR:FEE1:M2H', 'prefix': 'MIRR:FEE1:M2H',
+                'name': 'FEE M2H'})
+    db[m2h['_id']] = m2h
+    systems = simplejson.load(open(system_json))
+    systems['m2h'] = dict(systems['m1h'], mirror='FEE M2H')
+    simplejson.dump(db, open(happi_json, 'w'))
+    simplejson.dump(systems, open(system_json, 'w'))
+    cfg = ConfigReader(happi_json, system_json, cache_size=1)
+    evicted = list()
+    cfg.add_evict_callback(lambda system, objs: evicted.append(system))
+    m1h = cfg.get_subsystem('m1h')
+    m2h = cfg.get_subsystem('m2h')
+    assert evicted == ['m1h']
+    assert cfg['m1h'] is None
+    #Only the device that is no longer used is released
+    assert 'FEE M1H' not in cfg.devices
+    assert cfg.devices['HX2 PIM'] is m1h['imager'] is m2h['imager']
+    #Pinned systems stay loaded
+    cfg.pin(['m2h'])
+    m1h = cfg.get_subsystem('m1h')
+    assert evicted == ['m1h']
+    assert cfg['m2h'] is m2h
+    assert cfg['m1h'] is m1h
+
+@using_fake_epics_pv
+def test_eviction_during_batch_load(config_files):
+    happi_json, system_json = config_files
+    db = simplejson.load(open(happi_json))
+    #Copies of every device under new names
+    for _id, doc in list(db.items()):
+        copy = dict(doc, _id=_id + '2', name=doc['name'] + ' 2')
+        db[copy['_id']] = copy
+    systems = simplejson.load(open(system_json))
+    #m2h uses none of the devices of m1h while m3h shares its imager and slits
+    systems['m2h'] = {'mirror': 'FEE M1H 2', 'imager': 'HX2 PIM 2',
+                      'slits': 'HX2 Slits 2', 'rotation': 90}
+    systems['m3h'] = dict(systems['m1h'], mirror='FEE M1H 2')
+    simplejson.dump(db, open(happi_json, 'w'))
+    simplejson.dump(systems, open(system_json, 'w'))
+    cfg = ConfigReader(happi_json, system_json, cache_size=1)
+    m1h = cfg.get_subsystem('m1h')
+    #Caching m2h evicts m1h before m3h is cached
+    loaded = cfg.get_subsystems(['m2h', 'm3h'])
+    assert cfg['m1h'] is None
+    m3h = loaded['m3h']
+    assert m3h['imager'] is m1h['imager']
+    assert cfg.devices['HX2 PIM'] is m3h['imager']
+    assert cfg.devices['HX2 Slits'] is m3h['slits']
+    #The mirror only m1h used is released
+    assert 'FEE M1H' not in cfg.devices
+
+def test_import_is_lightweight():
+    #Check in a fresh interpreter so other tests can not affect the result
+    code = ('import sys, skywalker.config; '
+            'print(skywalker.config._sim_config is None, '
+            '\'pswalker.examples\' in sys.modules)')
+    out = subprocess.check_output([sys.executable, '-c', code],
+                                  cwd=os.path.join(os.path.dirname(__file__),
+                                                   '..'))
+    assert out.decode().split() == ['True', 'False']
+
+def test_sim_loading():
+    cfg = SimConfigReader()
+    system = cfg.get_subsystem('sim_m1h')
+    assert system['mirror'].name == 'test_m1h'
+    #The simulated beamline is only created once
+    assert SimConfigReader().get_subsystem('sim_m1h') is system
+    #Simulated devices are paired with containers like live ones
+    for container, device in cfg.iter_configuration():
+        assert container.name == device.name
+        assert container.active
+
+def test_sim_beamline():
+    cfg = SimConfigReader(n_mirrors=5, n_imagers=7, rotation=90)
+    assert len(cfg.available_systems) == 7
+    #Mirrors are grouped in branches of two, the last branch has one
+    assert sorted(cfg.alignments) == ['Branch 0', 'Branch 1', 'Branch 2']
+    systems = [system for procedure in cfg.alignments.values()
+               for key_set in procedure for system in key_set]
+    assert sorted(systems) == sorted(cfg.available_systems)
+    system = cfg.get_subsystem('sim_0000')
+    assert system['mirror'].name == 'sim_mirror_0000'
+    assert system['rotation'] == 90
+    assert cfg.load_device('sim_imager_0006') is cfg['sim_0006']['imager']
+
+def test_sim_system_ready():
+    cfg = SimConfigReader(n_mirrors=2)
+    system = cfg.get_subsystem('sim_0000')
+    #Simulated systems have no slits, which are not waited on
+    assert system['slits'] is None
+    ready = cfg.system_ready('sim_0000')
+    assert ready.result(timeout=0) == [system['mirror'], system['imager']]
+
+@using_fake_epics_pv
+def test_concurrent_requests():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    #Count how many times each device is created, slowly enough that the
+    #threads overlap
+    created = Counter()
+    construct = cfg._construct_device
+
+    def slow_construct(name):
+        created[name] += 1
+        time.sleep(0.1)
+        return construct(name)
+
+    cfg._construct_device = slow_construct
+    barrier = threading.Barrier(24)
+    results = list()
+
+    def hammer(i):
+        barrier.wait()
+        if i % 3 == 0:
+            results.append(cfg.get_subsystem('m1h')['mirror'])
+        elif i % 3 == 1:
+            results.append(cfg.get_subsystems(['m1h', 'm2h'])['m1h']['mirror'])
+        else:
+            results.append(cfg.load_device('FEE M1H', timeout=5))
+
+    threads = [threading.Thread(target=hammer, args=(i,)) for i in range(24)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 24
+    assert all(dev is results[0] for dev in results)
+    assert created['FEE M1H'] == 1
+    assert max(created.values()) == 1
+    assert cfg['m1h']['mirror'] is results[0]
+
+@using_fake_epics_pv
+def test_claim_after_load():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    system = cfg.get_subsystem('m1h')
+    claim = cfg._system_flight.claim
+
+    def late_claim(key):
+        #Another thread finished loading just before the claim was made
+        cfg.cache[key] = system
+        return claim(key)
+
+    cfg._system_flight.claim = late_claim
+    cfg.cache.pop('m1h')
+    assert cfg.get_subsystem('m1h') is system
+    assert cfg['m1h'] is system
+    cfg.cache.pop('m1h')
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(cfg.async_get_subsystem('m1h')) is system
+    finally:
+        loop.close()
+    assert not cfg._system_flight.pending()
+
+@using_fake_epics_pv
+def test_signal_manifest():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    mirror = cfg.load_device('FEE M1H', timeout=5)
+    #Every signal in the manifest is connected
+    assert mirror.pitch.user_readback.connected
+    assert mirror.pitch.motor_done_move.connected
+    record = cfg.report.as_dict()['FEE M1H']
+    assert 3 <= record['created'] <= record['signals']
+    assert record['connected'] >= 3
+    #Devices without a manifest connect everything
+    cfg.signal_manifests = {}
+    mirror = cfg.load_device('FEE M1H', use_cache=False, timeout=5)
+    record = cfg.report.as_dict()['FEE M1H']
+    assert record['created'] == record['signals']
+    assert cfg._manifest_signals('FEE M1H', mirror) is None
+    #As do devices whose manifest does not match the class
+    cfg.signal_manifests = {'OffsetMirror': ['pitch.user_readback',
+                                             'pitch.not_a_signal']}
+    assert cfg._manifest_signals('FEE M1H', mirror) is None
+    mirror = cfg.load_device('FEE M1H', use_cache=False, timeout=5)
+    assert mirror is not None
+    (devices, failures) = cfg.load_devices(['FEE M1H'], use_cache=False,
+                                           timeout=5)
+    assert devices[0] is not None
+
+@using_fake_epics_pv
+def test_background_connection():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'), background=True)
+    #Hold the connections until the devices have been returned
+    release = threading.Event()
+    failing = set()
+    connect = cfg._connect
+
+    def held_connect(name, dev, timeout=1):
+        release.wait(5)
+        if name in failing:
+            raise TimeoutError("Signals did not connect")
+        return connect(name, dev, timeout=timeout)
+
+    cfg._connect = held_connect
+    system = cfg.get_subsystem('m1h', timeout=5)
+    mirror = system['mirror']
+    assert mirror is not None
+    assert not cfg.ready(mirror.name).done()
+    ready = cfg.system_ready('m1h')
+    assert not ready.done()
+    release.set()
+    assert ready.result(timeout=5) == [system[dev_type]
+                                       for dev_type in cfg.device_types]
+    assert cfg.ready(mirror.name).result() is mirror
+    #Failed devices are dropped along with their systems
+    failing.add('HX2 Slits')
+    cfg.devices.pop('HX2 Slits')
+    cfg.cache.pop('m1h')
+    system = cfg.get_subsystem('m1h', timeout=5)
+    with pytest.raises(TimeoutError):
+        cfg.system_ready('m1h').result(timeout=5)
+    assert 'HX2 Slits' not in cfg.devices
+    assert 'm1h' not in cfg.cache
+    assert 'HX2 Slits' in cfg.failures
+    #Devices loaded in the foreground are ready immediately
+    cfg._connect = connect
+    cfg.background = False
+    slits = cfg.load_device('HX2 Slits', use_cache=False, timeout=5)
+    assert cfg.ready('HX2 Slits').result(timeout=0) is slits
+
+@using_fake_epics_pv
+def test_async_background_failure():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'), background=True)
+    connect = cfg._connect
+
+    def failing_connect(name, dev, timeout=1):
+        if name == 'HX2 Slits':
+            raise TimeoutError("Signals did not connect")
+        return connect(name, dev, timeout=timeout)
+
+    load = cfg.async_load_device
+
+    async def load_and_wait(name, **kwargs):
+        #The connection fails before the system is cached
+        dev = await load(name, **kwargs)
+        try:
+            await asyncio.wrap_future(cfg.ready(name))
+        except TimeoutError:
+            pass
+        return dev
+
+    cfg._connect = failing_connect
+    cfg.async_load_device = load_and_wait
+    loop = asyncio.new_event_loop()
+    try:
+        system = loop.run_until_complete(cfg.async_get_subsystem('m1h'))
+    finally:
+        loop.close()
+    assert system['slits'] is not None
+    assert 'HX2 Slits' not in cfg.devices
+    assert 'm1h' not in cfg.cache
+
+@using_fake_epics_pv
+def test_reload_during_system_load():
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    load = cfg._load_concurrently
+
+    def reload_after_load(*args, **kwargs):
+        devices = load(*args, **kwargs)
+        #A reload replaces a device before the system is cached
+        cfg.devices.pop('HX2 PIM')
+        return devices
+
+    cfg._load_concurrently = reload_after_load
+    system = cfg.get_subsystem('m1h')
+    assert system['imager'] is not None
+    assert 'm1h' not in cfg.cache
+    #Once nothing is replaced the system is cached again
+    cfg._load_concurrently = load
+    assert cfg.get_subsystem('m1h')['imager'] is not None
+    assert 'm1h' in cfg.cache
@@ -0,0 +1,71 @@
+############
+# Standard #
+############
+import os
+
+###############
+# Third Party #
+###############
+import pytest
+
+##########
+# Module #
+##########
+from skywalker.config import ConfigReader
+from skywalker.diskcache import MetadataCache, atomic_write
+from pcdsdevices.sim.pv import using_fake_epics_pv
+
+
+def test_cache_roundtrip(config_files, tmpdir):
+    cache = MetadataCache(config_files, cache_dir=str(tmpdir.join('cache')))
+    assert cache.load() is None
+    cache.save({'value': 1})
+    assert cache.load() == {'value': 1}
+    #Touching the file does not invalidate the cache
+    os.utime(config_files[0], None)
+    assert cache.load() == {'value': 1}
+    #Changing the contents does
+    with open(config_files[1], 'a') as f:
+        f.write('\n')
+    assert cache.load() is None
+
+
+def test_edit_while_parsing(config_files, tmpdir):
+    cache = MetadataCache(config_files, cache_dir=str(tmpdir.join('cache')))
+    fingerprints = cache.fingerprints()
+    #The file is edited after it was read but before the cache is saved
+    with open(config_files[1], 'a') as f:
+        f.write('\n')
+    cache.save({'value': 1}, fingerprints)
+    assert cache.load() is None
+
+
+@using_fake_epics_pv
+def test_config_reader_cache(config_files, tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    cfg = ConfigReader(*config_files, cache_dir=cache_dir)
+    #The parsed information was stored
+    data = MetadataCache(config_files, cache_dir=cache_dir).load()
+    assert data['systems'] == cfg.live_systems
+    assert data['resolved']['FEE M1H']['device_class'] == 'OffsetMirror'
+    #A new reader is configured from the cache
+    cfg = ConfigReader(*config_files, cache_dir=cache_dir)
+    assert cfg.documents == data['documents']
+    devs, containers = cfg.load_configuration()
+    assert len(devs) == 3
+
+
+def test_atomic_write(tmpdir):
+    path = str(tmpdir.join('data.txt'))
+    atomic_write(path, lambda f: f.write('first'))
+    assert open(path).read() == 'first'
+
+    def fail(f):
+        f.write('partial')
+        raise RuntimeError("Interrupted")
+
+    #A failed write leaves the previous contents and no temporary file
+    with pytest.raises(RuntimeError):
+        atomic_write(path, fail)
+    assert open(path).read() == 'first'
+    assert os.listdir(str(tmpdir)) == ['data.txt']
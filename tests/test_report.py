@@ -0,0 +1,49 @@
+###############
+# Third Party #
+###############
+import simplejson
+
+##########
+# Module #
+##########
+from skywalker.config import ConfigReader
+from skywalker.report import LoadReport
+from pcdsdevices.sim.pv import using_fake_epics_pv
+from conftest import make_test_path
+
+
+def test_report_phases():
+    report = LoadReport()
+    with report.phase('dev', 'lookup'):
+        pass
+    report.update('dev', connect=1.0, signals=4, created=3, connected=3)
+    record = report.as_dict()['dev']
+    assert record['total'] >= 1.0
+    assert report.signal_counts() == {'signals': 4, 'created': 3,
+                                      'connected': 3, 'avoided': 1}
+    assert '1 left unconnected' in report.summary()
+    assert report.slowest(count=1)[0]['name'] == 'dev'
+    assert report.failures() == {}
+    report.update('bad', error='TimeoutError: dead')
+    assert report.failures() == {'bad': 'TimeoutError: dead'}
+    assert 'bad' in report.summary()
+
+
+@using_fake_epics_pv
+def test_config_report(tmpdir):
+    cfg = ConfigReader(make_test_path('happi.json'),
+                       make_test_path('system.json'))
+    cfg.load_configuration()
+    cfg.load_device('Not a device')
+    records = cfg.report.as_dict()
+    mirror = records['FEE M1H']
+    assert mirror['device_class'] == 'OffsetMirror'
+    assert all(mirror[phase] is not None for phase in LoadReport.phases)
+    assert 'SearchError' in cfg.report.failures()['Not a device']
+    #Dump the report
+    json_path = str(tmpdir.join('report.json'))
+    cfg.report.dump(json_path)
+    assert len(simplejson.load(open(json_path))) == 4
+    csv_path = str(tmpdir.join('report.csv'))
+    cfg.report.dump(csv_path)
+    assert len(open(csv_path).readlines()) == 5
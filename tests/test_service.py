@@ -0,0 +1,60 @@
+############
+# Standard #
+############
+import threading
+
+###############
+# Third Party #
+###############
+import pytest
+import simplejson
+
+##########
+# Module #
+##########
+from skywalker.config import ConfigReader
+from skywalker.service import ConfigService, fetch_metadata, request
+from conftest import make_test_path
+
+
+@pytest.fixture(scope='function')
+def service(config_files, tmpdir):
+    happi_json, system_json = config_files
+    service = ConfigService(happi_json, system_json,
+                            path=str(tmpdir.join('config.sock')))
+    thread = threading.Thread(target=service.serve_forever, daemon=True)
+    thread.start()
+    yield service
+    service.shutdown()
+    service.server_close()
+
+
+def test_service(service):
+    happi_json = service.sources['happi']
+    system_json = service.sources['system']
+    cfg = ConfigReader(happi_json, system_json, service=service.path)
+    assert service.served == 1
+    assert cfg.get_systems_with('FEE M1H') == ['m1h']
+    #Only a second copy is refused
+    with pytest.raises(OSError):
+        ConfigService(happi_json, system_json, path=service.path)
+    assert request(service.path, 'unknown')['error']
+    #Edits are picked up by the service
+    systems = simplejson.load(open(system_json))
+    systems['m3h'] = systems['m1h']
+    simplejson.dump(systems, open(system_json, 'w'))
+    assert cfg.reload(force=True).systems == ['m3h']
+    assert service.served == 2
+
+
+def test_service_fallback(service, tmpdir):
+    #Files other than the ones being served
+    happi_json = make_test_path('happi.json')
+    system_json = make_test_path('system.json')
+    assert fetch_metadata(service.path, happi_json, system_json) is None
+    cfg = ConfigReader(happi_json, system_json, service=service.path)
+    assert cfg.get_systems_with('FEE M1H') == ['m1h']
+    #No service running
+    cfg = ConfigReader(happi_json, system_json,
+                       service=str(tmpdir.join('missing.sock')))
+    assert 'm1h' in cfg.available_systems